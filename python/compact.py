@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Compact flow network for millions of nodes:  node state in typed arrays, nodes as views."""
+
+#A Network node is a dict with reverse and flow_out bags, a last_tick and an entry in the energy bag:
+#  several Python objects and hash tables per node before it has any edges.
+#CompactNetwork numbers nodes 0..n-1 and keeps energy, last_tick and flow (energy moved by the
+#  node's last push) in parallel arrays.  Edges of a node are None, an array of alternating
+#  node index and capacity while there are few, or a dict {node index: capacity}.
+#Ids are the indexes themselves as long as nodes 0, 1, 2... are added in order; any other id
+#  switches on an intern table (ids list and id: index dict).
+#benchmark() measures memory per node:  about 40 bytes for an edgeless node (1 KB for Network)
+#  and 230 bytes with one edge (Network 1050 bytes).
+#XXX flow_out per edge isn't kept, only its total.  Node subclasses (Source, Sink...) aren't supported.
+
+from array import array
+import os, random
+
+from network import *
+
+SMALL_DEGREE = 8    #most edges a node keeps in an array before switching to a dict
+
+
+def _items(edges):
+    """Return list of (node index, capacity) in edges."""
+    if edges is None: return []
+    if type(edges) is dict: return edges.items()
+    return zip(edges[::2], edges[1::2])
+
+def _get(edges, index):
+    """Return capacity of edge to index, 0 if there is none."""
+    if edges is None: return 0
+    if type(edges) is dict: return edges.get(index, 0)
+    for k in xrange(0, len(edges), 2):
+        if edges[k] == index: return edges[k + 1]
+    return 0
+
+def _put(edges, index, capacity):
+    """Set capacity of edge to index (removing it if 0), returning the edges to keep in place of edges.
+
+    >>> edges = None
+    >>> for i in range(SMALL_DEGREE + 1): edges = _put(edges, i, i + 1)
+    >>> type(edges), _get(edges, 8)
+    (<type 'dict'>, 9)
+    >>> _put(_put(None, 1, 3), 1, 0)
+    """
+    if type(edges) is dict:
+        if capacity: edges[index] = capacity
+        else: edges.pop(index, None)
+        return edges or None
+    if edges is None:
+        if capacity: return array('l', [index, capacity])
+        return None
+    for k in xrange(0, len(edges), 2):
+        if edges[k] == index:
+            if capacity: edges[k + 1] = capacity
+            else: del edges[k:k + 2]
+            return edges or None
+    if capacity:
+        if len(edges) < 2 * SMALL_DEGREE: edges.extend((index, capacity))
+        else:
+            edges = dict(_items(edges))
+            edges[index] = capacity
+    return edges
+
+
+class CompactNode(object):
+    """View of one node of a CompactNetwork, made on access.  Holds nothing but network and index.
+
+    >>> n = CompactNetwork(3)
+    >>> n[0][1] = 2; n[0][2] = 1
+    >>> n[0].energy = 5
+    >>> print n[0], n[1].reverse
+    5 {1: 2, 2: 1} {0: 2}
+    >>> n[0][2] = 0     #zero capacity removes the edge
+    >>> 2 in n[0], n[0][2], len(n[0])
+    (False, 0, 1)
+    """
+
+    __slots__ = ['_graph', '_index']
+
+    def __init__(self, network, index):
+        self._graph = network
+        self._index = index
+
+    def _edges(self, reverse=False):
+        """Return outgoing (or incoming) edges, None if there are none.  See _items."""
+        return (self._graph.into if reverse else self._graph.out)[self._index]
+
+    def __getitem__(self, sink):
+        i = self._graph._intern(sink)
+        if i is None: return 0
+        return _get(self._edges(), i)
+
+    def __setitem__(self, sink, capacity):
+        net = self._graph
+        net._set_edge(self._index, net._intern(sink, True), int(capacity))
+
+    def __delitem__(self, sink):
+        if sink not in self: raise KeyError(sink)
+        self[sink] = 0
+
+    def __contains__(self, sink):
+        return self[sink] != 0     #zero capacity edges aren't kept
+
+    def __len__(self):
+        edges = self._edges()
+        if type(edges) is dict: return len(edges)
+        return len(edges or ()) // 2
+
+    def iteritems(self, reverse=False):
+        id_of = self._graph.id_of
+        for i, capacity in _items(self._edges(reverse)):
+            yield id_of(i), capacity
+
+    def __iter__(self):
+        for sink, capacity in self.iteritems():
+            yield sink
+
+    def _id_read(self): return self._graph.id_of(self._index)
+    def _energy_read(self): return self._graph.energy[self._index]
+    def _energy_write(self, value): self._graph._set_energy(self._index, int(value))
+    def _last_tick_read(self):
+        tick = self._graph.last_tick[self._index]
+        if tick >= 0: return tick
+    def _flow_read(self): return self._graph.flow[self._index]
+    def _reverse_read(self): return FlowType(dict(self.iteritems(True)))
+
+    _id = property(_id_read, None, None, "Node id.")
+    energy = property(_energy_read, _energy_write, None, "Energy at node.")
+    last_tick = property(_last_tick_read, None, None, "Tick of the node's last push, None if it never pushed.")
+    flow = property(_flow_read, None, None, "Energy moved out by the node's last push.")
+    reverse = property(_reverse_read, None, None, "Bag of incoming edges:  {head id: capacity}.")
+
+    def __str__(self):
+        return "%r %s" % (self.energy, FlowType(dict(self.iteritems())))
+
+
+class CompactNetwork(object):
+    """Flow network storing node state in parallel arrays.  Ticks like Network:  each node with
+    energy pushes along randomly chosen units of capacity, then all flow arrives at once.
+    Random choices differ from Network's, deterministic runs give the same result.
+
+    >>> n = CompactNetwork()
+    >>> n[1][2] = 2; n[2][3] = 1; n[3][1] = -1
+    >>> n[1].energy = 4
+    >>> net = n.to_network()
+    >>> n(6); net(6)
+    >>> print n
+    {1: -1 {2: 2}, 2: 0 {3: 1}, 3: 3 {1: -1}}
+    >>> str(n) == str(net), n.ticks == net.ticks, n.total_energy
+    (True, True, 2)
+    >>> n[2].flow, n[2].last_tick, n[1].last_tick
+    (1, 4, 5)
+
+    Ids 0, 1, 2... added in order are their own indexes.  Any other hashable id starts an intern table:
+    >>> CompactNetwork(10).index
+    >>> n['a']['b'] = 1
+    >>> n.index['a'], len(n), 'b' in n, n[4].last_tick
+    (3, 5, True, None)
+    """
+
+    __slots__ = ['ids', 'index', 'energy', 'last_tick', 'flow', 'out', 'into', 'active', 'ticks']
+
+    def __init__(self, size=0):
+        """Create network with edgeless nodes 0..size-1."""
+        self.ids = None         #id of each index, None while every id is its own index
+        self.index = None       #id: index, None while every id is its own index
+        self.energy = array('l', [0]) * size        #energy at each node, write through _set_energy
+        self.last_tick = array('l', [-1]) * size    #tick of each node's last push, -1 for never
+        self.flow = array('l', [0]) * size          #energy moved out by each node's last push
+        self.out = [None] * size    #edges to tail indexes per node, see _items
+        self.into = [None] * size   #edges from head indexes per node
+        self.active = set()         #indexes of nodes with energy
+        self.ticks = 0              #number of network clock ticks since creation
+
+    def _intern(self, vid, create=False):
+        """Return index of node vid, adding the node if create is set.  None if there's no such node."""
+        if self.index is None:
+            size = len(self.out)
+            if type(vid) is int and 0 <= vid <= size:
+                if vid < size: return vid
+                if create: return self._grow(vid)
+                return None
+            if not create: return None
+            self.ids = range(size)
+            self.index = dict.fromkeys(self.ids)
+            for i in self.ids: self.index[i] = i
+        i = self.index.get(vid)
+        if i is None and create: i = self._grow(vid)
+        return i
+
+    def _grow(self, vid):
+        i = len(self.out)
+        self.energy.append(0)
+        self.last_tick.append(-1)
+        self.flow.append(0)
+        self.out.append(None)
+        self.into.append(None)
+        if self.index is not None:
+            self.ids.append(vid)
+            self.index[vid] = i
+        return i
+
+    def id_of(self, index):
+        if self.ids is None: return index
+        return self.ids[index]
+
+    def _set_edge(self, head, tail, capacity):
+        self.out[head] = _put(self.out[head], tail, capacity)
+        self.into[tail] = _put(self.into[tail], head, capacity)
+
+    def _set_energy(self, index, value):
+        self.energy[index] = value
+        if value: self.active.add(index)
+        else: self.active.discard(index)
+
+    def add(self, head, tail, capacity=1):
+        """Add edge from head to tail, creating either node as needed."""
+        self._set_edge(self._intern(head, True), self._intern(tail, True), capacity)
+
+    def __getitem__(self, vid):
+        """Return view of node vid, creating the node if it doesn't exist (like Graph)."""
+        return CompactNode(self, self._intern(vid, True))
+
+    def __contains__(self, vid):
+        return self._intern(vid) is not None
+
+    def __len__(self):
+        return len(self.out)
+
+    def __iter__(self):
+        if self.ids is None: return iter(xrange(len(self.out)))
+        return iter(self.ids)
+
+    def __call__(self, ticks=1):
+        """Advance network for specified ticks, defaults to 1."""
+        assert ticks >= 0
+        for tic in xrange(ticks):
+            self._tick()
+
+    def _tick(self):
+        """Advance network one tick.  Returns amount of energy moved during the tick."""
+        energy, last_tick, flow, tick = self.energy, self.last_tick, self.flow, self.ticks
+        arrivals, moved = [], 0
+        for i in list(self.active):
+            bits = energy[i]
+            sent = self._send(i, bits, arrivals)
+            last_tick[i], flow[i] = tick, sent
+            moved += sent
+            self._set_energy(i, bits - sent if bits > 0 else bits + sent)
+        for i, bits in arrivals:    #all flow arrives after every push, as in Network._pull
+            self._set_energy(i, energy[i] + bits)
+        if moved: self.ticks += 1
+        return moved
+
+    def _send(self, index, bits, arrivals):
+        """Push bits from node along its edges (incoming edges if bits < 0), appending
+        (node index, energy) to arrivals.  Returns energy moved."""
+        edges = self.out[index] if bits > 0 else self.into[index]
+        if not edges: return 0
+        sign, count = bits > 0 and 1 or -1, abs(bits)
+        edges = _items(edges)
+        if count >= sum([abs(capacity) for i, capacity in edges]):     #enough energy for every unit of capacity
+            for i, capacity in edges:
+                arrivals.append((i, sign * capacity))
+                count -= abs(capacity)
+            return abs(bits) - count
+        population = []     #as in Node._pick
+        for i, capacity in edges:
+            population.extend([(i, capacity >= 0 and sign or -sign)] * abs(capacity))
+        arrivals.extend(random.sample(population, count))
+        return count
+
+    def _total_energy(self):
+        energy = self.energy
+        return sum([energy[i] for i in self.active])
+
+    total_energy = property(_total_energy, None, None, "Total energy in network.")
+
+    def from_network(cls, net):
+        """Return CompactNetwork copy of net's edges, energy and ticks.  Nodes of any type are copied as plain nodes.
+
+        >>> net = Network({1: {2: 3}})
+        >>> net.energy[2] = 1
+        >>> print CompactNetwork.from_network(net)
+        {1: 0 {2: 3}, 2: 1 {}}
+        """
+        compact = cls()
+        for nid in net:     #intern all ids first so 0..n-1 in order need no intern table
+            compact._intern(nid, True)
+        for nid, node in net.iteritems():
+            for sink, capacity in node.iteritems():
+                compact.add(nid, sink, capacity)
+        for nid, bits in net.energy.iteritems():
+            compact[nid].energy = bits
+        compact.ticks = net.ticks
+        return compact
+
+    from_network = classmethod(from_network)
+
+    def to_network(self):
+        """Return Network copy of edges, energy and ticks."""
+        net = Network()
+        id_of = self.id_of
+        for i in xrange(len(self.out)):
+            net.add(id_of(i))
+            for tail, capacity in _items(self.out[i]):
+                net[id_of(i)][id_of(tail)] = capacity
+        for i in self.active:
+            net.energy[id_of(i)] = self.energy[i]
+        net.ticks = self.ticks
+        return net
+
+    def __str__(self):
+        ids = list(self)
+        ids.sort()
+        return '{%s}' % ', '.join(["%r: %s" % (vid, self[vid]) for vid in ids])
+
+    def _validate(self):
+        """Assert CompactNetwork invariants.
+
+        >>> n = CompactNetwork(2)
+        >>> n.energy[1] = 3     #bypassing _set_energy
+        >>> n._validate()
+        Traceback (most recent call last):
+        AssertionError: active set out of step with energy
+        """
+        size = len(self.out)
+        assert len(self.energy) == len(self.last_tick) == len(self.flow) == len(self.into) == size
+        assert (self.ids is None) == (self.index is None)
+        if self.ids is not None:
+            assert len(self.ids) == len(self.index) == size
+            for i, vid in enumerate(self.ids):
+                assert self.index[vid] == i, "intern table out of step"
+        assert self.active == set([i for i in xrange(size) if self.energy[i]]), "active set out of step with energy"
+        edges, reverse = 0, 0
+        for head, tails in enumerate(self.out):
+            assert tails is None or tails, "empty edges kept"
+            for tail, capacity in _items(tails):
+                assert capacity, "zero capacity edge"
+                assert _get(self.into[tail], head) == capacity, "reverse edge missing"
+                edges += 1
+        for tail, heads in enumerate(self.into):
+            assert heads is None or heads, "empty edges kept"
+            reverse += len(_items(heads))
+        assert edges == reverse, "reverse edge without edge"
+
+
+def _resident():
+    """Return resident memory of this process in bytes (Linux only)."""
+    f = open('/proc/self/statm')
+    try: pages = int(f.read().split()[1])
+    finally: f.close()
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+def _measure(make, n):
+    """Return bytes per node used by make(n), measured in a forked child so runs don't share memory."""
+    import gc, struct
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        gc.disable()
+        before = _resident()
+        net = make(n)
+        os.write(write, struct.pack('d', float(_resident() - before) / n))
+        os._exit(0)
+    os.close(write)
+    result = os.read(read, 8)
+    os.close(read)
+    os.waitpid(pid, 0)
+    return struct.unpack('d', result)[0]
+
+def _compact_nodes(n): return CompactNetwork(n)
+
+def _compact_ring(n):
+    net = CompactNetwork(n)
+    for i in xrange(n):
+        net._set_edge(i, (i + 1) % n, 1)
+    return net
+
+def _network_nodes(n):
+    from generate import build
+    return build((), n)
+
+def _network_ring(n):
+    from generate import build
+    return build(((i, (i + 1) % n) for i in xrange(n)), n)
+
+def benchmark(sizes=(10**6, 10**7), network_limit=10**6):
+    """Print bytes per node of edgeless networks and rings (one edge per node) of each size.
+    Network is only built up to network_limit nodes.
+    Each build runs in its own forked process."""
+    print "%10s %-16s %12s" % ('nodes', 'network', 'bytes/node')
+    for n in sizes:
+        for name, make, limited in [('CompactNetwork', _compact_nodes, False), ('  with ring', _compact_ring, False),
+                                    ('Network', _network_nodes, True), ('  with ring', _network_ring, True)]:
+            if not limited or n <= network_limit:
+                print "%10d %-16s %12.1f" % (n, name, _measure(make, n))
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Source node reading a corpus of many (possibly compressed) text files."""
+
+#Worker threads open, decompress and filter upcoming shards ahead of the tick loop.  A tick finding
+#  no block ready yet is idle, as with runner.QueueSource, rather than waiting for one.
+#Each shard has its own bounded queue of filtered blocks so shards are served in order,
+#  and a worker doesn't start a new shard until its current one is queued:  at most
+#  threads * maxsize blocks are held in memory.
+#A checkpoint saves the shard being served and the offset into its decompressed text.  Restoring
+#  starts a new generation of workers there; those of the old one stop at their next block.
+
+import glob, gzip, bz2, threading, time, Queue
+
+try: import lzma     #Python 3 or backports.lzma, only needed for .xz
+except ImportError:
+    try: from backports import lzma
+    except ImportError: lzma = None
+
+from network import *
+
+
+def open_shard(path):
+    """Open path for reading, decompressing according to its extension."""
+    if path.endswith('.gz'): return gzip.open(path, 'rb')
+    elif path.endswith('.bz2'): return bz2.BZ2File(path, 'rb')
+    elif path.endswith('.xz'):
+        if lzma is None: raise ImportError("lzma module needed to read %s" % path)
+        return lzma.open(path, 'rb')
+    else: return open(path, 'rb')
+
+
+class CorpusSource(FileSource):
+    """Source that reads a list of files, or a glob pattern, one after the other.
+    Files ending in .gz, .bz2 or .xz are decompressed.  The end of each file reads as whitespace.
+
+    >>> f = gzip.open('/tmp/corpus1.gz', 'wb'); written = f.write('ab'); f.close()
+    >>> f = bz2.BZ2File('/tmp/corpus2.bz2', 'wb'); f.write('b!'); f.close()
+    >>> n = Network()
+    >>> n.attach(CorpusSource, ['/tmp/corpus1.gz', '/tmp/corpus2.bz2'])
+    'corpus'
+    >>> for t in n['corpus'].readers: t.join()   #wait for all input to be read
+    >>> n(10); print n
+    {'A': 1 {}, 'B': 2 {}, 'corpus': 0 {'A': 1, 'B': 2}}
+    >>> n['corpus'].chars, n['corpus'].bytes
+    (4, 4)
+
+    A glob pattern is used as the node id:
+    >>> n.attach(CorpusSource, '/tmp/corpus*')
+    '/tmp/corpus*'
+
+    Checkpoints keep the read position:
+    >>> n = Network()
+    >>> n.attach(CorpusSource, ['/tmp/corpus1.gz', '/tmp/corpus2.bz2'])
+    'corpus'
+    >>> for t in n['corpus'].readers: t.join()
+    >>> n(2); n.checkpoint('/tmp/corpus.ckpt', True); n['corpus']._getstate()[3:]
+    (0, 2)
+    >>> n(10); n.restore('/tmp/corpus.ckpt')
+    >>> for t in n['corpus'].readers: t.join()
+    >>> n(10); print n
+    {'A': 1 {}, 'B': 2 {}, 'corpus': 0 {'A': 1, 'B': 2}}
+    """
+
+    __slots__ = ['paths', 'bytes', 'chars', 'started', 'readers', 'threads', 'maxsize',
+                 '_queues', '_shard', '_offset', '_next', '_generation', '_lock']
+
+    def __init__(self, network, paths, name=None, threads=2, maxsize=8):
+        if isinstance(paths, basestring):
+            name, paths = name or paths, sorted(glob.glob(paths))
+        self.paths = list(paths)
+        self.source = None
+        self._buffer, self._cursor = '', 0
+        self.bytes = 0      #decompressed bytes read by workers
+        self.chars = 0      #characters served to ticks
+        self.started = time.time()
+        self.threads, self.maxsize = threads, maxsize
+        self._generation = 0
+        self._queues = None
+        Source.__init__(self, network, name or 'corpus')   #skip FileSource init, there's no single file
+        self._begin(0, 0)
+
+    def _begin(self, shard, offset):
+        """Start a new generation of workers, reading from offset into shard.  Each generation has
+        its own queues, lock and next shard, so workers of an old one touch nothing of the new."""
+        old = self._queues
+        self._generation += 1
+        self._queues = [Queue.Queue(self.maxsize) for path in self.paths]   #filtered blocks per shard, '' at end
+        self._shard = shard     #shard being served
+        self._offset = offset   #characters of the shard before _buffer
+        self._next = [shard]    #next shard for a worker of this generation to start
+        self._lock = threading.Lock()   #guards _next and bytes
+        for queue in old or ():     #unblock old workers, which then see they're out of date
+            while queue is not None and not queue.empty():
+                try: queue.get_nowait()
+                except Queue.Empty: break
+        self.readers = []   #worker threads
+        args = (self._generation, self._lock, self._queues, self._next, shard, offset)
+        for i in range(min(self.threads, len(self.paths) - shard)):
+            t = threading.Thread(target=self._work, args=args)
+            t.daemon = True
+            t.start()
+            self.readers.append(t)
+
+    def _work(self, generation, lock, queues, next, first, skip):
+        """Worker thread: read shards in turn, queueing filtered blocks.  Shard first starts at skip."""
+        while True:
+            lock.acquire()
+            i = next[0]
+            next[0] += 1
+            lock.release()
+            if i >= len(self.paths) or generation != self._generation: return
+            queue = queues[i]
+            try:
+                f = open_shard(self.paths[i])
+                try:
+                    while i == first and skip > 0:  #decompressed streams can't seek, so read up to offset
+                        block = f.read(min(skip, BLOCKSIZE))
+                        if not block: break
+                        skip -= len(block)
+                    block = f.read(BLOCKSIZE)
+                    while block:
+                        if generation != self._generation: return
+                        lock.acquire()
+                        self.bytes += len(block)
+                        lock.release()
+                        queue.put(block.translate(FILTER_TABLE))
+                        block = f.read(BLOCKSIZE)
+                finally: f.close()
+                if generation != self._generation: return
+                queue.put('')
+            except Exception, error:
+                queue.put(error)    #re-raised in the tick loop
+
+    def _pull(self):
+        try:
+            bit_id = self._buffer[self._cursor]
+        except IndexError:
+            if self._shard >= len(self.paths): return None  #EOF on last shard
+            try:
+                block = self._queues[self._shard].get_nowait()
+            except Queue.Empty:
+                return " "  #nothing ready, idle tick
+            if isinstance(block, Exception): raise block
+            if not block:   #end of shard
+                self._queues[self._shard] = None
+                self._shard += 1
+                self._buffer, self._cursor, self._offset = '', 0, 0
+                return " "
+            self._offset += len(self._buffer)
+            self._buffer, self._cursor = block, 0
+            bit_id = block[0]
+        self._cursor += 1
+        self.chars += 1
+        return bit_id
+
+    def throughput(self):
+        """Return (bytes, characters) per second since creation."""
+        seconds = time.time() - self.started
+        return self.bytes / seconds, self.chars / seconds
+
+    def _getstate(self):
+        """Node state plus shard being served and offset into its decompressed text."""
+        return Node._getstate(self) + (self._shard, self._offset + self._cursor)
+
+    def _setstate(self, state):
+        Node._setstate(self, state)
+        self._buffer, self._cursor = '', 0
+        self._begin(*state[3:5])
+
+    _mark, _rewind = Node._mark.im_func, Node._rewind.im_func  #not rewound by a journal
+
+    def _validate(self):
+        assert self.in_degree() == 0, "Unexpected in_vertices: %s" % self.reverse
+        Source._validate(self)
+
+    def __del__(self): pass     #no file to close
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Generators of large random networks for benchmarks and tests."""
+
+#Vertices are numbered 0..n-1.  Edges are written straight into the vertex dicts (and reverse bags)
+#  instead of through Graph.add/Vertex.__setitem__, which check and create vertices for every edge.
+#Every generator takes the same keyword options, see build().
+
+import random
+
+from network import *
+
+
+def _value(option, rng):
+    """Option is a constant or a function of rng."""
+    if callable(option): return option(rng)
+    return option
+
+def build(edges, n, graph=None, capacity=1, energy=0, sources=0, sinks=0, seed=None):
+    """Fill graph (a new Network by default) with vertices 0..n-1 and the (head, tail) pairs in edges.
+
+    capacity and energy are ints or functions of a random.Random giving one value per edge or vertex.
+    sources and sinks are numbers of Source nodes ('source', i) feeding one random vertex each and
+    Sink nodes ('sink', i) fed by one random vertex each.  Same seed, same network.
+
+    >>> n = build([(0, 1), (1, 2), (2, 0)], 3, capacity=2, energy=lambda rng: 5, sources=1, sinks=1, seed=1)
+    >>> n._validate(); len(n), n.total_energy, n.energy[0]
+    (5, 17, 5)
+    >>> g = build([(0, 1), (1, 1)], 2, Graph())
+    >>> print g
+    {0: {1}, 1: {1}}
+
+    Capacities are coerced to int, edges given capacity 0 are left out, and negative ones are refused:
+    >>> n = build([(0, 1), (1, 2), (2, 0)], 3, capacity=lambda rng: rng.choice([0, 1.5]), seed=2)
+    >>> n._validate(); print n
+    {0: 0 {1: 1}, 1: 0 {2: 1}, 2: 0 {}}
+    >>> build([(0, 1)], 2, capacity=-1)
+    Traceback (most recent call last):
+    ValueError: Negative capacity -1 for edge (0, 1)
+    """
+    import gc
+    gc.disable()    #collector would otherwise rescan the growing graph many times over
+    try: return _build(edges, n, graph, capacity, energy, sources, sinks, random.Random(seed))
+    finally: gc.enable()
+
+def _build(edges, n, graph, capacity, energy, sources, sinks, rng):
+    g = Network() if graph is None else graph
+    VertexType, put = g.VertexType, dict.__setitem__
+    vertex = dict.__getitem__
+    new = VertexType is Node and Node._blank or VertexType   #skip per-vertex __init__ work where possible
+    for vid in xrange(n):
+        if not dict.__contains__(g, vid): put(g, vid, new(g, vid))
+    if issubclass(VertexType, Vertex): capacity = True
+    reverse = issubclass(VertexType, reverse_edge_mixin)
+    clean = getattr(VertexType, '_filter', None)    #bag vertices (Node) keep int capacities, as __setitem__ would
+    value, varying = capacity, callable(capacity)
+    if clean is not None and not varying: value = clean(value)
+    for head, tail in edges:
+        if varying:
+            value = capacity(rng)
+            if clean is not None: value = clean(value)
+        if value <= 0:
+            if value: raise ValueError("Negative capacity %r for edge %r" % (value, (head, tail)))
+            continue    #no edge, as bags drop zero counts
+        put(vertex(g, head), tail, value)
+        if reverse: put(vertex(g, tail).reverse, head, value)
+    if isinstance(g, Network):
+        if energy:
+            for vid in xrange(n):
+                e = _value(energy, rng)
+                if e: put(g.energy, vid, int(e))
+        for i in range(sources):
+            sid = g.attach(Source, ('source', i))
+            g[sid][rng.randrange(n)] = _value(capacity, rng)
+            g[sid].energy = g[sid].sum_out()
+        for i in range(sinks):
+            sid = g.attach(Sink, ('sink', i))
+            g[rng.randrange(n)][sid] = _value(capacity, rng)
+    return g
+
+def erdos_renyi(n, m=None, p=None, **options):
+    """Random directed graph with m edges, or on average p * n * (n-1) edges (no loops).
+
+    >>> net = erdos_renyi(1000, 5000, seed=3)
+    >>> net._validate(); len(net), sum([len(v) for v in net.itervalues()])
+    (1000, 5000)
+    """
+    rng = random.Random(options.get('seed'))
+    if m is None: m = int(round(p * n * (n - 1)))
+    chosen, rand = set(), rng.random
+    while len(chosen) < m:
+        head, tail = int(rand() * n), int(rand() * n)
+        if head != tail: chosen.add((head, tail))
+    return build(chosen, n, **options)
+
+def barabasi_albert(n, m, **options):
+    """Preferential attachment:  each new vertex links to m distinct earlier vertices,
+    chosen with probability proportional to their degree.
+
+    >>> net = barabasi_albert(1000, 3, seed=3)
+    >>> net._validate(); sum([len(v) for v in net.itervalues()])
+    2991
+    """
+    rng = random.Random(options.get('seed'))
+    edges, ends = [], range(m)   #ends holds each vertex once per edge it's on
+    for head in xrange(m, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(ends))
+        for tail in targets:
+            edges.append((head, tail))
+        ends.extend(targets)
+        ends.extend([head] * m)
+    return build(edges, n, **options)
+
+def small_world(n, k, p, **options):
+    """Watts-Strogatz:  ring where each vertex links to its k following vertices,
+    with each edge rewired to a random tail with probability p.
+
+    >>> net = small_world(100, 4, 0.0)
+    >>> sorted(net[99])
+    [0, 1, 2, 3]
+    >>> net = small_world(1000, 4, 0.1, seed=3)
+    >>> net._validate(); sum([len(v) for v in net.itervalues()])
+    4000
+    """
+    rng = random.Random(options.get('seed'))
+    edges = {}
+    for head in xrange(n):
+        for j in range(1, k + 1):
+            tail = (head + j) % n
+            if rng.random() < p:
+                tail = rng.randrange(n)
+                while tail == head or (head, tail) in edges:
+                    tail = rng.randrange(n)
+            edges[head, tail] = True
+    return build(edges, n, **options)
+
+def lattice(shape, **options):
+    """Grid with edges both ways between neighbouring vertices.  Vertex ids are row-major indices.
+
+    >>> net = lattice((3, 4))
+    >>> sorted(net[5]), len(net)
+    ([1, 4, 6, 9], 12)
+    """
+    n, strides = 1, []
+    for size in reversed(shape):
+        strides.insert(0, n)
+        n *= size
+    edges = []
+    for vid in xrange(n):
+        for size, stride in zip(shape, strides):
+            if (vid // stride) % size + 1 < size:
+                edges.append((vid, vid + stride))
+                edges.append((vid + stride, vid))
+    return build(edges, n, **options)
+
+def layered_dag(layers, width, fanout, **options):
+    """Layers of width vertices, each linking to fanout random vertices of the next layer.
+
+    >>> net = layered_dag(3, 10, 2, seed=3)
+    >>> len(net), sum([len(v) for v in net.itervalues()]), len(net[25])
+    (30, 40, 0)
+    """
+    rng = random.Random(options.get('seed'))
+    edges = []
+    for layer in range(layers - 1):
+        next_layer = range((layer + 1) * width, (layer + 2) * width)
+        for head in xrange(layer * width, (layer + 1) * width):
+            for tail in rng.sample(next_layer, fanout):
+                edges.append((head, tail))
+    return build(edges, layers * width, **options)
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
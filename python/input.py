@@ -3,36 +3,96 @@
 # This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
 # email: dreamingforward@gmail.com
 
+"""Serial text input into a hierarchy of LayerNets, each learning the frequent pairs of the one below."""
+
+#SerialIn.pull streams files (and bytearrays, buffers) a block at a time:  each block is filtered
+#  (uppercase, drop non-letters) with str.translate, then LayerNet.pull_many splits it on whitespace,
+#  counts bits and bigrams and updates each layer in turn.  Other str items are single bits (tokens),
+#  collected into words so that they too are pulled in bulk.
+#A Pipeline instead runs each layer's part on its own thread, so lower layers go on with the next
+#  block while upper ones take in the words promoted from the last.
+
+from bisect import bisect
+import heapq, threading, Queue
+from collections import Counter
+from itertools import chain
+
 from network import *
 
 GraphList = []
 
+#filter for text read from files as str.translate arguments:  letters to uppercase, whitespace to space, all else deleted
+_UPPER = ''.join([c.isspace() and ' ' or c.upper() for c in map(chr, range(256))])
+_DROP = ''.join([c for c in map(chr, range(256)) if not (c.isalpha() or c.isspace())])
+
+
+def items(info, size=BLOCKSIZE):
+    """Yield (True, text block) for each file (or anything with read), bytearray and buffer in info,
+    and (False, item) for any other item, str included.  Info may be any of these, or an iterable
+    of them nested to any depth.
+
+    >>> list(items(['ab', ['c', bytearray('d')], iter([1])]))
+    [(False, 'ab'), (False, 'c'), (True, 'd'), (False, 1)]
+    """
+    stack = [iter((info,))]     #explicit stack instead of recursion, so any nesting depth will do
+    while stack:
+        try: item = stack[-1].next()
+        except StopIteration:
+            stack.pop()
+            continue
+        if isinstance(item, str): yield False, item
+        elif isinstance(item, (bytearray, buffer)): yield True, str(item)
+        elif hasattr(item, 'read'):
+            block = item.read(size)
+            while block:
+                yield True, block
+                block = item.read(size)
+        elif hasattr(item, '__iter__'): stack.append(iter(item))
+        else: yield False, item
+
+
 class SerialIn:
+    """Feeds input to a LayerNet.  Files are read as text, one bit per letter, with whitespace between
+    words; any other str is one bit (uppercased), or a space if it is whitespace, and is dropped unless
+    all letters.  Items of lists, and other iterables, are pulled in turn.
+
+    >>> s = SerialIn()
+    >>> s.pull(['the', 'then', ['they', 'tHe.']]); print s.upnet
+    {'THE': 1 {'THEN': 1}, 'THEN': 1 {'THEY': 1}, 'THEY': 1 {}}
+    >>> from StringIO import StringIO
+    >>> s = SerialIn()
+    >>> s.pull(StringIO('the then they the.')); print s.upnet['T']
+    4 {'H': 4}
+    >>> print s.upnet.upnet
+    {'TH': 1 {}}
+
+    With pipelined set, layers are run by a Pipeline, and pull() returns once all are done:
+    >>> s = SerialIn(pipelined=True)
+    >>> s.pull([StringIO('the then they the.'), 'x', ' ', 'y']); print s.upnet.upnet
+    {'TH': 1 {}}
+    >>> sorted(s.upnet['E'])    #file text runs on into the next item, as with a later pull
+    ['N', 'X', 'Y']
+    """
 
-    def __init__(self, network=None):
+    def __init__(self, network=None, pipelined=False):
         if network==None: network=LayerNet()
         self.attach(network)
+        self.pipeline = Pipeline(network) if pipelined else None
 
     def pull(self, info):
-        if isinstance(info, list):  #XXX Note recursion: what if info is list in list?
-            for bit in info:
-                self.pull(bit)
-            return
-        elif isinstance(info, file):
-            for line in info:
-                for bit in line:
-                    self.pull(bit)
-            return
-        bit = self.filter(info)
-        if bit:
-            self.upnet.pull(bit)
-
-    def filter(self, bit):
-        if not isinstance(bit, str):
-            return bit
-        elif bit.isalpha() or bit.isspace():
-            return bit.upper()
-        else: return None
+        """Pull info:  see items() for what it may be."""
+        target = self.upnet if self.pipeline is None else self.pipeline
+        words = [[]]    #bits of consecutive str items, a new word after each space
+        for text, item in items(info):
+            if text:
+                if words != [[]]: target.pull_words(words)
+                words = [[]]
+                target.pull_many(item.translate(_UPPER, _DROP))
+            elif not isinstance(item, str): words[-1].append(item)
+            elif item.isspace(): words.append([])
+            elif item.isalpha(): words[-1].append(item.upper())
+        if words != [[]]: target.pull_words(words)
+        if self.pipeline is not None: self.pipeline.flush()
 
     def attach(self, network):
         self.upnet = network
@@ -46,35 +106,356 @@ class SerialIn:
         return s
 
 class LayerNet(Network):
+    """Network of bits whose frequent pairs are promoted, as one bit, to the LayerNet above.
+
+    With a budget, each layer holds at most that many vertices plus edges:  once over it, evict()
+    brings the layer down to 3/4 of budget, according to policy:
+      'count':  remove the lowest-count edges, and vertices left without edges by lowest energy.
+      'lru':    same, but least recently reinforced first.
+      'decay':  scale all counts and energies by decay (rounding down) until the layer fits, so
+                only what keeps recurring survives, as in frequent-items counting.
+    Layers created above have the same budget and policy.  Evicting as it goes, pull_many() can
+    give different counts than pull() as they evict at different times.
+
+    >>> import random; rng = random.Random(1)
+    >>> n = LayerNet(40)
+    >>> for i in range(1000): n.pull_many('THE CAT SAT %s ' % ''.join(rng.sample('BDFGJKLMPQUVWXYZ', 4)))
+    >>> n['T']['H'], n['A']['T'], n.energy['T']     #frequent pairs stay, most random ones are gone
+    (1000, 2000, 3000)
+    >>> layer = n
+    >>> while layer is not None:
+    ...     assert len(layer) + layer.edges <= 40; layer._validate()
+    ...     layer = layer.upnet
+    """
 
-    def __init__(self):
+    def __init__(self, budget=None, policy='count', decay=0.5):
         super(LayerNet, self).__init__()
+        if policy not in ('count', 'lru', 'decay'): raise ValueError("Unknown eviction policy: %r" % policy)
+        if not 0 < decay < 1: raise ValueError("decay must be between 0 and 1")
         self.upnet = None
         self.lastbit = None
         self.link_threshold = 4
         self.toggle = 0
+        self.budget = budget    #maximum vertices plus edges, None for no limit
+        self.policy = policy
+        self.decay = decay
+        self.edges = 0          #number of edges, kept up to date by pulls and evict()
+        self.clock = 0          #pulls so far, for the 'lru' policy
+        self._stamps = {} if policy == 'lru' else None  #bit or (head, tail): clock when last pulled
+        self.depth = 0          #layers below this one
+        self.index = None       #TokenIndex told of new and removed bits and energy changes
+
+    def _layer(self):
+        """Return a new layer to go above this one, with the same settings."""
+        layer = self.__class__(self.budget, self.policy, self.decay)
+        layer.depth = self.depth + 1
+        if self.index is not None: self.index._layer(layer)
+        return layer
+
+    def _discard(self, vid):
+        """Remove vertex vid and its energy."""
+        if self.index is not None: self.index._remove(self.depth, vid, self.energy[vid])
+        del self[vid]
 
     def pull(self, bit):
         if bit.isspace():
             self.lastbit = None
             return
-        self.add(bit)
-        self[bit].energy += 1 #note v.sum_out() == v.energy
-        if self.lastbit:
-            self[self.lastbit][bit] += 1
-            if self[self.lastbit][bit] >= self.link_threshold:
-                self.create(self.lastbit, bit)
-            elif self.upnet:
-                self.upnet.pull(" ")
-            self.lastbit = bit
-        else: self.lastbit = bit
+        self.pull_word((bit,), False)
+
+    def pull_word(self, word, ended=True):
+        """Pull each bit of word (a str's characters are its bits), then a space if ended.
+        Same as calling pull() for each, with edges and energy written directly.
+
+        >>> n = LayerNet()
+        >>> n.pull_word('ABAB'); n.pull_word('AB', False); n.pull_word('CD')
+        >>> print n
+        {'A': 3 {'B': 3}, 'B': 3 {'A': 1, 'C': 1}, 'C': 1 {'D': 1}, 'D': 1 {}}
+        >>> n._validate()
+        """
+        energy, threshold, index = self.energy, self.link_threshold, self.index
+        direct = self.journal is None and self._dirty is None  #else edges go through Node, which tells them
+        get, put = dict.get, dict.__setitem__
+        stamps, clock = self._stamps, self.clock + 1
+        self.clock = clock
+        last = self.lastbit
+        if last: lastnode = dict.__getitem__(self, last)
+        for bit in word:
+            node = get(self, bit)
+            if node is None:
+                self.add(bit)
+                node = get(self, bit)
+                if index is not None: index._add(self.depth, bit)
+            count = get(energy, bit, 0) + 1  #note v.sum_out() == v.energy
+            if count: put(energy, bit, count)
+            else: dict.__delitem__(energy, bit)
+            if index is not None: index._energy(self.depth, bit, count - 1, count)
+            if stamps is not None: stamps[bit] = clock
+            if last:
+                count = get(lastnode, bit, 0) + 1
+                if count and direct:   #what Node.__setitem__ does for a new or larger count
+                    put(lastnode, bit, count)
+                    put(node.reverse, last, count)
+                    lastnode._sample = node._rsample = None
+                else: lastnode[bit] = count
+                if count == 1: self.edges += 1
+                if stamps is not None: stamps[last, bit] = clock
+                if count >= threshold:
+                    self.create(last, bit)
+                elif self.upnet:
+                    self.upnet.lastbit = None   #same as self.upnet.pull(" ")
+            last, lastnode = bit, node
+        self.lastbit = None if ended else last
+        if self.budget is not None and len(self) + self.edges > self.budget: self.evict()
+
+    def pull_many(self, text):
+        """Pull each character of text (uppercase letters and spaces, as SerialIn makes of files) as pull() would.
+        Bits and bigrams of the whole text are counted at once and written to the network in bulk,
+        then the layer above pulls the pairs promoted to it, in the order pull() would have sent them.
+
+        >>> text = 'THE THEN THERE  THAT THEY THE THEM OTHER ' * 4
+        >>> a, b = LayerNet(), LayerNet()
+        >>> for bit in text: a.pull(bit)
+        >>> for i in range(0, len(text), 7): b.pull_many(text[i:i + 7])
+        >>> while a is not None:
+        ...     print str(a) == str(b), a.lastbit == b.lastbit, a.toggle == b.toggle, len(a)
+        ...     a, b = a.upnet, b.upnet
+        True True True 9
+        True True True 8
+        True True True 1
+        """
+        self.pull_words(text.split(' '))
+
+    def pull_words(self, words):
+        """Pull each sequence of bits in words, with a space between one and the next, as pull() would."""
+        layer = self
+        while words is not None:
+            words = layer._pull_words(words)
+            layer = layer.upnet
+
+    def _pull_words(self, words):
+        """Pull sequences of bits in words, each but the last followed by a space.
+        Returns words for upnet to pull in turn, None if there's nothing for it."""
+        energy, threshold, index = self.energy, self.link_threshold, self.index
+        direct = self.journal is None and self._dirty is None  #else edges go through Node, which tells them
+        get, put = dict.get, dict.__setitem__
+        stamps, clock = self._stamps, self.clock + 1
+        self.clock = clock
+        if isinstance(words[0], str):   #characters:  count each distinct one with str.count
+            text = ''.join(words)
+            bits = dict([(bit, text.count(bit)) for bit in set(text)])
+        else: bits = Counter(chain.from_iterable(words))
+        for bit, n in bits.iteritems():
+            if not dict.__contains__(self, bit):
+                self.add(bit)
+                if index is not None: index._add(self.depth, bit)
+            count = get(energy, bit, 0) + n
+            if count: put(energy, bit, count)
+            else: dict.__delitem__(energy, bit)
+            if index is not None: index._energy(self.depth, bit, count - n, count)
+            if stamps is not None: stamps[bit] = clock
+        last, pairs = self.lastbit, []
+        for i, word in enumerate(words):
+            if i: last = None   #space before word
+            if word:
+                if last: pairs.append((last, word[0]))
+                pairs.extend(zip(word, word[1:]))
+                last = word[-1]
+        self.lastbit = last
+        if not pairs: return self._fit(None)
+        always, crossing = set(), {}    #pairs promoted on every occurrence, and pair: occurrence reaching threshold
+        for pair, n in Counter(pairs).iteritems():
+            first, second = pair
+            head, tail = dict.__getitem__(self, first), dict.__getitem__(self, second)
+            old = get(head, second, 0)
+            if old + 1 >= threshold: always.add(pair)
+            elif old + n >= threshold: crossing[pair] = threshold - old
+            if old + n and direct:     #as in pull_word
+                put(head, second, old + n)
+                put(tail.reverse, first, old + n)
+                head._sample = tail._rsample = None
+            else: head[second] = old + n
+            if not old: self.edges += 1
+            if stamps is not None: stamps[pair] = clock
+        promote = [pair in always for pair in pairs]
+        if crossing:
+            seen = dict.fromkeys(crossing, 0)
+            for i in [i for i, pair in enumerate(pairs) if pair in crossing]:
+                pair = pairs[i]
+                seen[pair] += 1
+                promote[i] = seen[pair] >= crossing[pair]
+        #each promotion calls create(), which passes on every other one
+        promoted = [i for i, p in enumerate(promote) if p]
+        sent = promoted[1 if self.toggle else 0::2]
+        if len(promoted) % 2: self.toggle = not self.toggle
+        resets = [i for i, p in enumerate(promote) if not p]    #upnet.pull(" ") when upnet exists
+        if self.upnet is None:     #an upnet may be empty yet, if a Pipeline hasn't fed it
+            if not sent: return self._fit(None)
+            self.upnet = self._layer()
+            resets = resets[bisect(resets, sent[0]):]
+        up = [[] for i in xrange(len(resets) + 1)]
+        for i in sent:
+            up[bisect(resets, i)].append(pairs[i][0] + pairs[i][1])
+        return self._fit(up)
+
+    def _fit(self, result):
+        """Evict if over budget, then return result."""
+        if self.budget is not None and len(self) + self.edges > self.budget: self.evict()
+        return result
+
+    def evict(self, size=None):
+        """Remove edges and vertices, as policy says, until at most size remain (3/4 of budget by default,
+        nothing to do without a budget).  Removal goes through Node and Network, so reverse bags and
+        energy stay consistent.  The last bit pulled is kept, as the next pull links to it.
+
+        >>> n = LayerNet()
+        >>> n.pull_word('ABABAXCDC')
+        >>> n.evict(); len(n)
+        5
+        >>> n.evict(7); print n
+        {'A': 3 {'B': 2}, 'B': 2 {'A': 2}, 'C': 2 {}, 'X': 1 {'C': 1}}
+        >>> n._validate(); n.edges
+        3
+        """
+        if size is None:
+            if self.budget is None: return  #no limit
+            size = self.budget * 3 // 4
+        self.edges = sum([len(node) for node in self.itervalues()])
+        if self.policy == 'decay': return self._decay(size)
+        stamps, energy, vertex = self._stamps or {}, self.energy, dict.__getitem__
+        heap = []   #(rank, head, tail) of edges, and of vertices without edges with tail None
+        for head, node in self.iteritems():
+            for tail, count in node.iteritems():
+                heap.append(((stamps.get((head, tail), 0), count), head, tail))
+            if not node and not node.reverse and head != self.lastbit:
+                heap.append(((stamps.get(head, 0), energy[head]), head, None))
+        heapq.heapify(heap)
+        while heap and len(self) + self.edges > size:
+            rank, head, tail = heapq.heappop(heap)
+            if tail is None:
+                self._discard(head)
+                stamps.pop(head, None)
+                continue
+            del vertex(self, head)[tail]
+            stamps.pop((head, tail), None)
+            self.edges -= 1
+            for vid in set((head, tail)):   #vertices left without edges are ranked with the rest
+                node = vertex(self, vid)
+                if not node and not node.reverse and vid != self.lastbit:
+                    heapq.heappush(heap, ((stamps.get(vid, 0), energy[vid]), vid, None))
+
+    def _decay(self, size):
+        """Scale counts and energies down by decay until at most size vertices and edges remain."""
+        energy, vertex = self.energy, dict.__getitem__
+        while len(self) + self.edges > size and (self.edges or energy):  #else only the last bit is left
+            for head, node in self.items():
+                for tail, count in node.items():
+                    count = int(count * self.decay)
+                    if count: node[tail] = count
+                    else:
+                        del node[tail]
+                        self.edges -= 1
+                old = energy[head]
+                if old:
+                    energy[head] = int(old * self.decay)
+                    if self.index is not None: self.index._energy(self.depth, head, old, energy[head])
+            for vid in [vid for vid, node in self.iteritems()
+                            if not node and not node.reverse and not energy[vid] and vid != self.lastbit]:
+                self._discard(vid)
 
     def create(self, first, second):
         self.toggle = not self.toggle
         if not self.toggle: return
-        if not self.upnet: self.upnet = self.__class__()
-        self.upnet.pull(first+second) #XXX could check if both chars and send concat string
+        if not self.upnet: self.upnet = self._layer()
+        self.upnet.pull_word((first+second,), False) #same as pull(first+second)
+
+
+class Pipeline(object):
+    """Runs the layers of a LayerNet hierarchy as stages, each on its own thread taking words
+    from a bounded queue and putting those it promotes on the queue of the layer above.
+    pull_many() blocks while the bottom queue is full, and each stage while the next one's is,
+    so no more than maxsize blocks wait at each layer.  After flush() the layers are the same
+    as after calling LayerNet.pull_many with the same blocks.
+
+    >>> text = 'THE THEN THERE  THAT THEY THE THEM OTHER ' * 20
+    >>> a, b = LayerNet(), LayerNet()
+    >>> p = Pipeline(b, 2)
+    >>> for i in range(0, len(text), 7): a.pull_many(text[i:i + 7]); p.pull_many(text[i:i + 7])
+    >>> p.close()
+    >>> while a is not None:
+    ...     print str(a) == str(b), a.lastbit == b.lastbit, a.toggle == b.toggle, len(a)
+    ...     a, b = a.upnet, b.upnet
+    True True True 9
+    True True True 8
+    True True True 6
+    True True True 3
+    True True True 3
+    True True True 1
+    """
+
+    __slots__ = ['network', 'maxsize', 'queues', 'error']
+
+    def __init__(self, network, maxsize=16):
+        self.network = network      #bottom layer
+        self.maxsize = maxsize      #lists of words queued per layer
+        self.queues = []            #of each stage, from the bottom up
+        self.error = None           #first exception raised by a stage, re-raised by pull_many and flush
+        self._start(network)
+
+    def _start(self, layer):
+        queue = Queue.Queue(self.maxsize)
+        self.queues.append(queue)
+        t = threading.Thread(target=self._work, args=(layer, len(self.queues) - 1))
+        t.daemon = True
+        t.start()
+
+    def _work(self, layer, depth):
+        """Stage thread:  pull words for layer, passing on what it promotes."""
+        queue = self.queues[depth]
+        words = queue.get()
+        while words is not None:
+            try:
+                if self.error is None:  #after an error, just drain so flush doesn't wait forever
+                    up = layer._pull_words(words)
+                    if up is not None:
+                        if len(self.queues) == depth + 1: self._start(layer.upnet)
+                        self.queues[depth + 1].put(up)
+            except Exception, error:
+                self.error = error
+            finally: queue.task_done()
+            words = queue.get()
+
+    def _check(self):
+        if self.error is not None: raise self.error
+
+    def pull_many(self, text):
+        """Queue text (uppercase letters and spaces) to be pulled, as LayerNet.pull_many would."""
+        self.pull_words(text.split(' '))
+
+    def pull_words(self, words):
+        """Queue words to be pulled, as LayerNet.pull_words would."""
+        self._check()
+        self.queues[0].put(words)
+
+    def flush(self):
+        """Wait until every layer has pulled all that was queued."""
+        i = 0
+        while i < len(self.queues):     #stages above may start while waiting on those below
+            self.queues[i].join()
+            i += 1
+        self._check()
+
+    def close(self):
+        """Flush and stop the stage threads.  The Pipeline can't be used afterwards."""
+        try: self.flush()
+        finally:
+            for queue in self.queues:
+                queue.put(None)
+
 
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
 
 #n=LayerNet()
 #f=open('/home/average/rent','r')
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Instrumentation of the network tick loop:  time and calls per node class and phase."""
+
+#enable() swaps timing wrappers into the classes, disable() puts the originals back,
+#  so there is no cost at all while disabled.
+#Phases:  push = Node._push (includes read), read = FileSource/KeySource._pull,
+#  pull = Network._pull accumulation, validate = _validate, create = vertex creation through Graph.__getitem__.
+#Times are cumulative (like cProfile's cumtime): nested calls of the same phase,
+#  such as Source._push calling Node._push through super(), are charged to the outermost call.
+
+import os
+from timeit import default_timer as _timer
+
+from network import *
+
+_stats = {}         #(class name, phase): [calls, seconds, function]
+_originals = []     #(class, attribute name, original) to restore on disable()
+_busy = {}          #phase: True while a call of that phase is being timed
+
+
+def _where(func):
+    """Return function location in the filename:lineno(function) form used by pstats."""
+    code = func.func_code
+    return "%s:%d(%s)" % (os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+
+def _record(key, seconds, func):
+    s = _stats.get(key)
+    if s is None: s = _stats[key] = [0, 0.0, _where(func)]
+    s[0] += 1
+    s[1] += seconds
+
+def _timed(func, phase):
+    """Wrap method func, charging time to the class of self."""
+    def timed(self, *args):
+        if _busy.get(phase): return func(self, *args)
+        _busy[phase] = True
+        start = _timer()
+        try:
+            return func(self, *args)
+        finally:
+            _record((type(self).__name__, phase), _timer() - start, func)
+            _busy[phase] = False
+    timed.__name__, timed.__doc__ = func.__name__, func.__doc__
+    return timed
+
+def _pull(self, active_nodes):
+    """Network._pull, timed per node class."""
+    update = self.energy.update
+    for node in active_nodes:
+        start = _timer()
+        update(node.flow_out)
+        _record((type(node).__name__, 'pull'), _timer() - start, _original_pull)
+
+_original_pull = Network._pull.im_func
+
+def _getitem(self, vid):
+    """Graph.__getitem__, counting vertices it creates."""
+    if dict.__contains__(self, vid): return dict.__getitem__(self, vid)
+    start = _timer()
+    vertex = _original_getitem(self, vid)
+    _record((self.VertexType.__name__, 'create'), _timer() - start, _original_getitem)
+    return vertex
+
+_original_getitem = Graph.__getitem__.im_func
+
+def _subclasses(cls):
+    found = [cls]
+    for sub in cls.__subclasses__():
+        found.extend(_subclasses(sub))
+    return found
+
+def _patch(cls, name, replacement):
+    _originals.append((cls, name, cls.__dict__[name]))
+    setattr(cls, name, replacement)
+
+def enable():
+    """Install timing wrappers on all Node, vertex and Graph classes defined so far.
+
+    >>> n = Network({1: {2: 1}, 2: {3: 1}})
+    >>> n.attach(Source, 's')
+    's'
+    >>> n['s'][1] = 1
+    >>> enable()
+    >>> n(3); n.add(3, 4)
+    >>> s = stats()
+    >>> s['Source', 'push'][0], s['Node', 'push'][0], s['Node', 'pull'][0], s['Node', 'create'][0]
+    (3, 3, 3, 1)
+    >>> print report()  #doctest: +ELLIPSIS +NORMALIZE_WHITESPACE
+    class        phase       calls   cumtime   percall  function
+    ...
+    Node         push            3   ...network.py:...(_push)
+    ...
+    >>> disable()
+    >>> n(); stats()['Source', 'push'][0]
+    3
+    >>> reset(); stats()
+    {}
+    """
+    if _originals: return   #already enabled
+    for cls in _subclasses(Node):
+        if '_push' in cls.__dict__: _patch(cls, '_push', _timed(cls.__dict__['_push'], 'push'))
+    for cls in _subclasses(FileSource):
+        if '_pull' in cls.__dict__: _patch(cls, '_pull', _timed(cls.__dict__['_pull'], 'read'))
+    for cls in _subclasses(vertex_common) + _subclasses(reverse_edge_mixin) + _subclasses(Graph):
+        if '_validate' in cls.__dict__: _patch(cls, '_validate', _timed(cls.__dict__['_validate'], 'validate'))
+    _patch(Network, '_pull', _pull)
+    _patch(Graph, '__getitem__', _getitem)
+
+def disable():
+    """Remove timing wrappers.  Collected stats are kept until reset()."""
+    while _originals:
+        cls, name, original = _originals.pop()
+        setattr(cls, name, original)
+    _busy.clear()
+
+def reset():
+    _stats.clear()
+
+def stats():
+    """Return {(class name, phase): (calls, seconds, function)}."""
+    return dict([(key, tuple(s)) for key, s in _stats.iteritems()])
+
+def report():
+    """Return table of stats, largest time first.  The function column matches the
+    filename:lineno(function) names in cProfile/pstats output."""
+    lines = ["%-12s %-9s %7s %9s %9s  %s" % ('class', 'phase', 'calls', 'cumtime', 'percall', 'function')]
+    for (name, phase), (calls, seconds, where) in sorted(_stats.iteritems(), key=lambda item: -item[1][1]):
+        lines.append("%-12s %-9s %7d %9.6f %9.6f  %s" % (name, phase, calls, seconds, seconds / calls, where))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Journal of network changes, so ticks can be undone:  n(-k) undoes the last k ticks."""
+
+#Each tick appends one entry holding only what the tick changed:  old energy of nodes whose energy
+#  changed, old flow_out, last_tick and read position (Node._mark) of nodes that pushed, and
+#  edges set or removed during the tick (by FileSource, etc.).  Undoing applies entries newest first,
+#  so it takes time in proportion to the changes.  Only the last capacity ticks are kept.
+#Changes made between ticks aren't journaled, nor are random choices:  running again after an undo
+#  may take other paths, which is what what-if exploration wants.  Sink output can't be taken back.
+#While a journal is attached, converge and events are ignored so that every tick gets an entry.
+
+from collections import deque
+
+from network import *
+
+
+class Journal(object):
+    """Records each tick of network so that it can be undone.
+
+    >>> n = Network({1: {2: 1, 3: 1}, 2: {1: 1}})
+    >>> n.energy[1] = 3
+    >>> j = Journal(n, 100)
+    >>> n(2); before = str(n), n.ticks, n[1].last_tick, FlowType(n[1].flow_out)
+    >>> n(5); len(j)
+    7
+    >>> n(-5); (str(n), n.ticks, n[1].last_tick, n[1].flow_out) == before, len(j)
+    (True, 2)
+
+    Nodes and edges created during ticks are removed, and file sources reread:
+    >>> f = file('/tmp/network.tmp', 'w'); f.write('ab'); f.close()
+    >>> n = Network()
+    >>> n.attach(FileSource, open('/tmp/network.tmp'))
+    '/tmp/network.tmp'
+    >>> j = Journal(n)
+    >>> n(1); print n
+    {'/tmp/network.tmp': 1 {'A': 1}, 'A': 1 {}}
+    >>> n(5); n(-6); print n
+    {'/tmp/network.tmp': 1 {}}
+    >>> n(5); print n
+    {'/tmp/network.tmp': 0 {'A': 1, 'B': 1}, 'A': 1 {}, 'B': 1 {}}
+
+    Only capacity ticks can be undone:
+    >>> n(-7)
+    Traceback (most recent call last):
+    ValueError: Only 5 ticks journaled
+    """
+
+    __slots__ = ['network', 'capacity', '_entries', '_edits']
+
+    def __init__(self, network, capacity=1024):
+        """Attach a journal keeping the last capacity ticks of network."""
+        self.network = network
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)  #(ticks, old energies, node states, edge edits) per tick
+        self._edits = None      #[(node, sink, old capacity, sink created)] of tick in progress, appended by Node
+        network.journal = self
+
+    def _begin(self, active_nodes):
+        """Called by Network._tick before pushing active_nodes.  Returns what _end needs."""
+        self._edits = []
+        energy = self.network.energy
+        states = [(node, FlowType(node.flow_out), getattr(node, 'last_tick', None), node._mark(), energy[node._id])
+                  for node in active_nodes]
+        return self.network.ticks, states
+
+    def _end(self, entry):
+        """Called by Network._tick once the tick is done:  journal what changed.
+        Energy only changes on the nodes that pushed and on those they sent flow to,
+        which had none before unless they pushed too."""
+        ticks, states = entry
+        energy = self.network.energy
+        changed, pushed, kept = {}, set(), []
+        for state in states:
+            node, bits = state[0], state[4]
+            pushed.add(node._id)
+            if energy[node._id] != bits: changed[node._id] = bits
+            if state[3] is not None or state[1] != node.flow_out or state[2] != getattr(node, 'last_tick', None):
+                kept.append(state[:4])
+        for state in states:
+            for nid in state[0].flow_out:
+                if nid not in pushed: changed[nid] = 0
+        self._entries.append((ticks, changed, kept, self._edits))
+        self._edits = None
+
+    def __len__(self):
+        """Number of ticks that can be undone."""
+        return len(self._entries)
+
+    def undo(self, count=1):
+        """Undo the last count ticks."""
+        if count > len(self._entries): raise ValueError("Only %d ticks journaled" % len(self._entries))
+        net = self.network
+        for i in xrange(count):
+            ticks, changed, states, edits = self._entries.pop()
+            for node, sink, capacity, created in reversed(edits):
+                if capacity: node[sink] = capacity
+                elif sink in node: del node[sink]
+                if created: del net[sink]
+            if net._dirty is not None: net._dirty.update([state[0]._id for state in states])
+            for node, flow, last_tick, mark in states:
+                node.flow_out = flow
+                if last_tick is not None: node.last_tick = last_tick
+                elif hasattr(node, 'last_tick'): del node.last_tick
+                if mark is not None: node._rewind(mark)
+            for nid, e in changed.iteritems():
+                net.energy[nid] = e
+            net.ticks = ticks
+
+    def clear(self):
+        self._entries.clear()
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Force-directed 3-D layout of a Graph or Network, computed without any display, for demo.py and other viewers."""
+
+#Fruchterman-Reingold in 3-D, with the grid variant for repulsion:  space is cut into cubes of side
+#  reach * length, and vertices only push away those in their own and the 26 neighbouring cubes that are
+#  closer than that, so a step takes time in proportion to vertices and edges rather than vertices squared.
+#Edges pull as springs, harder for more capacity.  Vertices have mass (1 + degree, or 1 + energy) which
+#  pushes others away harder and makes the vertex itself slower to move:  links act as inertia, as in the
+#  gravity model demo.py asks for.  A weak pull towards the origin keeps separate components in view.
+#Each step moves a vertex at most temperature, which cools by a factor each step down to a floor, so
+#  that a viewer can call step() once per frame and the layout keeps adjusting as the graph changes.
+#With numpy, steps work on arrays of positions; without it the same step runs in pure Python.
+
+import math, random
+
+try: import numpy
+except ImportError: numpy = None
+
+from network import *
+
+
+class Layout(object):
+    """Positions for the vertices of graph, improved by each step().
+
+    >>> from generate import lattice
+    >>> g = lattice((6, 6))
+    >>> layout = Layout(g, seed=1)
+    >>> layout.step(300)
+    >>> d = layout.distance
+    >>> d(0, 1) < d(0, 7) < d(0, 35), 0.5 < d(0, 1) / layout.length < 2
+    (True, True)
+    >>> sorted(layout.positions())[:3], len(layout.positions()[0])
+    ([0, 1, 2], 3)
+
+    Vertices added to the graph are placed near their neighbours by sync():
+    >>> g.add(36, 0)
+    >>> layout.sync(); layout.step(10)
+    >>> d(36, 0) < d(36, 35)
+    True
+
+    Steps are the same with or without numpy:
+    >>> a, b = Layout(g, seed=2, vectorized=False), Layout(g, seed=2)
+    >>> a.step(20); b.step(20)
+    >>> max([abs(p - q) for v in g for p, q in zip(a.position(v), b.position(v))]) < 1e-6
+    True
+    """
+
+    __slots__ = ['graph', 'length', 'reach', 'cooling', 'gravity', 'mass', 'temperature', 'vectorized',
+                 'ids', 'index', 'pos', 'masses', 'heads', 'tails', 'weights', '_rng']
+
+    def __init__(self, graph, length=10.0, reach=2.0, cooling=0.97, gravity=0.01, mass='degree',
+                 seed=None, vectorized=None):
+        self.graph = graph
+        self.length = float(length)     #distance edges settle at
+        self.reach = reach              #in lengths, how far repulsion goes
+        self.cooling = cooling          #temperature factor per step
+        self.gravity = gravity          #pull to origin, per unit of distance
+        self.mass = mass                #'degree', 'energy' or function of (graph, vertex id)
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+        self.temperature = 0.0          #most a vertex moves in the next step
+        self.ids, self.index, self.pos = [], {}, []     #vertex ids, {id: index}, [x, y, z] per index
+        self._rng = random.Random(seed)
+        self.sync()
+
+    def sync(self):
+        """Take in vertices and edges added to or removed from graph since the last sync."""
+        graph, old = self.graph, dict(zip(self.ids, self._positions()))
+        self.ids = list(graph)
+        self.index = dict([(vid, i) for i, vid in enumerate(self.ids)])
+        heads, tails, weights, degree = [], [], [], [0] * len(self.ids)
+        for head, vertex in graph.iteritems():
+            h = self.index[head]
+            for tail, capacity in vertex.iteritems():
+                t = self.index[tail]
+                if h == t: continue
+                heads.append(h)
+                tails.append(t)
+                weights.append(abs(float(capacity)))
+                degree[h] += 1
+                degree[t] += 1
+        if self.mass == 'degree': masses = [1.0 + d for d in degree]
+        elif self.mass == 'energy': masses = [1.0 + abs(graph.energy[vid]) for vid in self.ids]
+        else: masses = [float(self.mass(graph, vid)) for vid in self.ids]
+        pos = [old.get(vid) for vid in self.ids]
+        new = [i for i, p in enumerate(pos) if p is None]
+        if new:
+            self._place(pos, new, heads, tails)
+            self.temperature = max(self.temperature, self.length * len(self.ids) ** (1 / 3.0))
+        self.heads, self.tails, self.weights = heads, tails, weights
+        if self.vectorized:
+            self.pos, self.masses = numpy.array(pos, float).reshape(-1, 3), numpy.array(masses)
+            self.heads, self.tails = numpy.array(heads, int), numpy.array(tails, int)
+            self.weights = numpy.array(weights)
+        else: self.pos, self.masses = pos, masses
+
+    def _positions(self):
+        """List of [x, y, z] per index."""
+        if self.vectorized: return [list(p) for p in self.pos]
+        return self.pos
+
+    def _place(self, pos, new, heads, tails):
+        """Set positions of indexes in new:  near neighbours placed before, or at random in the cube
+        holding a vertex per length cubed."""
+        rand, side = self._rng.random, self.length * max(len(pos), 1) ** (1 / 3.0)
+        neighbours = {}
+        for h, t in zip(heads, tails):
+            neighbours.setdefault(h, []).append(t)
+            neighbours.setdefault(t, []).append(h)
+        old = [p is not None for p in pos]
+        for i in new:
+            placed = [pos[j] for j in neighbours.get(i, ()) if old[j]]
+            if placed:
+                centre = [sum([p[c] for p in placed]) / len(placed) for c in range(3)]
+                pos[i] = [x + (rand() - 0.5) * self.length for x in centre]
+            else: pos[i] = [(rand() - 0.5) * side for c in range(3)]
+
+    def step(self, count=1):
+        """Move every vertex count times along the forces on it."""
+        for i in xrange(count):
+            if self.vectorized: self._step_arrays()
+            else: self._step()
+            self.temperature = max(self.temperature * self.cooling, self.length / 100)
+
+    def _step(self):
+        pos, masses, n = self.pos, self.masses, len(self.pos)
+        k2, cell = self.length ** 2, self.reach * self.length
+        disp = [[0.0, 0.0, 0.0] for i in xrange(n)]
+        grid = {}
+        for i, (x, y, z) in enumerate(pos):
+            grid.setdefault((int(math.floor(x / cell)), int(math.floor(y / cell)), int(math.floor(z / cell))), []).append(i)
+        offsets = [(a, b, c) for a in (-1, 0, 1) for b in (-1, 0, 1) for c in (-1, 0, 1)]
+        reach2 = cell * cell
+        for (cx, cy, cz), members in grid.iteritems():
+            near = []
+            for a, b, c in offsets:
+                near.extend(grid.get((cx + a, cy + b, cz + c), ()))
+            for i in members:
+                x, y, z = pos[i]
+                d = disp[i]
+                for j in near:
+                    if j == i: continue
+                    dx, dy, dz = x - pos[j][0], y - pos[j][1], z - pos[j][2]
+                    d2 = dx * dx + dy * dy + dz * dz
+                    if d2 >= reach2: continue
+                    f = k2 * masses[j] / max(d2, 1e-9)    #force k^2 / d, along (dx, dy, dz) / d
+                    d[0] += dx * f
+                    d[1] += dy * f
+                    d[2] += dz * f
+        for h, t, w in zip(self.heads, self.tails, self.weights):
+            ph, pt = pos[h], pos[t]
+            dx, dy, dz = ph[0] - pt[0], ph[1] - pt[1], ph[2] - pt[2]
+            f = w * math.sqrt(dx * dx + dy * dy + dz * dz) / self.length    #force d^2 / k, along (dx, dy, dz) / d
+            dh, dt = disp[h], disp[t]
+            dh[0] -= dx * f
+            dh[1] -= dy * f
+            dh[2] -= dz * f
+            dt[0] += dx * f
+            dt[1] += dy * f
+            dt[2] += dz * f
+        g, limit = self.gravity, self.temperature
+        for i in xrange(n):
+            p, d, m = pos[i], disp[i], masses[i]
+            ax, ay, az = d[0] / m - g * p[0], d[1] / m - g * p[1], d[2] / m - g * p[2]
+            size = math.sqrt(ax * ax + ay * ay + az * az)
+            if size > limit:
+                ax, ay, az = ax * limit / size, ay * limit / size, az * limit / size
+            p[0] += ax
+            p[1] += ay
+            p[2] += az
+
+    def _step_arrays(self):
+        """_step on arrays.  Pairs of vertices in neighbouring cells are listed for half of the
+        cell offsets, each pair pushing both ways, and the own cell's pairs only once."""
+        np, pos, masses, n = numpy, self.pos, self.masses, len(self.pos)
+        if not n: return
+        k2, cell = self.length ** 2, self.reach * self.length
+        disp = np.zeros((n, 3))
+        cells = np.floor(pos / cell).astype(np.int64)
+        cells -= cells.min(axis=0) - 1  #so that neighbours of every cell have coordinates >= 0
+        dims = cells.max(axis=0) + 2
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        order = np.argsort(keys, kind='mergesort')
+        sorted_keys = keys[order]
+        everyone = np.arange(n)
+        for a, b, c in [(a, b, c) for a in (-1, 0, 1) for b in (-1, 0, 1) for c in (-1, 0, 1) if (a, b, c) >= (0, 0, 0)]:
+            near = keys + (a * dims[1] + b) * dims[2] + c
+            start = np.searchsorted(sorted_keys, near, 'left')
+            counts = np.searchsorted(sorted_keys, near, 'right') - start
+            total = counts.sum()
+            if not total: continue
+            i = np.repeat(everyone, counts)
+            first = np.repeat(start - (np.cumsum(counts) - counts), counts)
+            j = order[first + np.arange(total)]
+            delta = pos[i] - pos[j]
+            d2 = (delta * delta).sum(axis=1)
+            keep = d2 < cell * cell
+            if (a, b, c) == (0, 0, 0): keep &= i < j
+            i, j, delta, d2 = i[keep], j[keep], delta[keep], d2[keep]
+            f = k2 / np.maximum(d2, 1e-9)
+            fi, fj = f * masses[j], f * masses[i]
+            for axis in range(3):
+                disp[:, axis] += np.bincount(i, delta[:, axis] * fi, n) - np.bincount(j, delta[:, axis] * fj, n)
+        if len(self.heads):
+            h, t = self.heads, self.tails
+            delta = pos[h] - pos[t]
+            f = self.weights * np.sqrt((delta * delta).sum(axis=1)) / self.length
+            for axis in range(3):
+                pull = np.bincount(h, delta[:, axis] * f, n) - np.bincount(t, delta[:, axis] * f, n)
+                disp[:, axis] -= pull
+        move = disp / masses[:, None] - self.gravity * pos
+        size = np.sqrt((move * move).sum(axis=1))
+        over = size > self.temperature
+        move[over] *= (self.temperature / size[over])[:, None]
+        pos += move
+
+    def position(self, vid):
+        """Return (x, y, z) of vertex vid."""
+        return tuple([float(x) for x in self.pos[self.index[vid]]])
+
+    def positions(self):
+        """Return {vertex id: (x, y, z)}."""
+        return dict([(vid, self.position(vid)) for vid in self.ids])
+
+    def distance(self, a, b):
+        """Distance between vertices a and b."""
+        return math.sqrt(sum([(p - q) ** 2 for p, q in zip(self.position(a), self.position(b))]))
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -12,15 +12,112 @@ The purpose of this module is to implement the unifed information model of the p
 and hopefully contribute to an ideal of Python 3000.
 """
 
-import sys
-from collections import Counter
+import sys, operator
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from itertools import izip
+
+try: import numpy
+except ImportError: numpy = None
 
 #sys.setrecursionlimit(50)
 
+#Operations on Mdicts walk both trees with an explicit stack of (result, left, right) subtrees instead of
+#  Python recursion, so any depth will do.  Subtrees found on one side only are put in the result as they
+#  are rather than copied:  results share them with the operands, so copy before changing one in place.
+#As with Counter, leaves that don't come out positive are dropped, and so are subtrees left empty.
+#A value that isn't a dict, met against a subtree, counts as {None: value}, as in m + 1.
+
+def _tree(value):
+    if isinstance(value, dict): return value
+    return Mdict({None: value})
+
+def _merge(left, right, leaf, union, share):
+    """Combine trees left and right, applying leaf(x, y) to pairs of leaves (missing ones are 0).
+    Union says whether keys in either tree are kept or only those in both, share whether a subtree
+    of right alone goes into the result as is (else it is combined with an empty subtree)."""
+    result = Mdict()
+    stack, made = [(result, _tree(left), _tree(right))], [(result, None, None)]
+    while stack:
+        r, a, b = stack.pop()
+        keys = a.viewkeys() | b.viewkeys() if union else a.viewkeys() & b.viewkeys()
+        for key in keys:
+            x, y = a.get(key), b.get(key)
+            if isinstance(x, dict) or isinstance(y, dict):
+                if y is None:
+                    if x: r[key] = x
+                elif x is None and share: r[key] = y
+                else:
+                    child = r[key] = Mdict()
+                    stack.append((child, Mdict() if x is None else _tree(x), _tree(y)))
+                    made.append((child, r, key))
+            else:
+                value = leaf(x or 0, y or 0)
+                if value > 0: r[key] = value
+    for r, parent, key in reversed(made):  #children come after their parents
+        if not r and parent is not None: del parent[key]
+    return result
+
+def sum_many(mdicts):
+    """Return the sum of mdicts, as adding them in turn would for positive counts, but adding each
+    into one result tree.  Subtrees are copied only when a second tree adds to them.
+
+    >>> ms = [Mdict({'a': Mdict({'x': i}), 'b': 1}) for i in range(1, 5)]
+    >>> sum_many(ms) == {'a': {'x': 10}, 'b': 4} == ms[0] + ms[1] + ms[2] + ms[3]
+    True
+    >>> sum_many([]), sum_many(ms[:1])['a'] is ms[0]['a']
+    (Mdict(), True)
+    """
+    result = Mdict()
+    owned = set([id(result)])   #subtrees made here, which may be changed in place
+    def own(parent, key, tree):
+        if id(tree) not in owned:
+            tree = parent[key] = Mdict(tree)
+            owned.add(id(tree))
+        return tree
+    for m in mdicts:
+        stack = [(result, _tree(m))]
+        while stack:
+            r, b = stack.pop()
+            for key, y in b.iteritems():
+                x = r.get(key)
+                if x is None: r[key] = y
+                elif isinstance(x, dict) or isinstance(y, dict):
+                    x = own(r, key, _tree(x))
+                    stack.append((x, _tree(y)))
+                else: r[key] = x + y
+    stack, made = [(result, None, None)], []
+    while stack:    #drop what didn't come out positive from the subtrees made here
+        r, parent, key = stack.pop()
+        made.append((r, parent, key))
+        for k, v in r.items():
+            if isinstance(v, dict):
+                if id(v) in owned: stack.append((v, r, k))
+            elif not v > 0: del r[k]
+    for r, parent, key in reversed(made):
+        if not r and parent is not None: del parent[key]
+    return result
+
+
 class Mdict(Counter):
     """Metadict:  for every operation d1 op d2, apply op to values where
     keys are in common. Cannot do arbitrary functions without breaking meta
-    abstraction.  One level of recursion should be sufficient for real apps?
+    abstraction.  Values may be Mdicts themselves, to any depth.
+
+    >>> m = Mdict({'a': Mdict({'x': 1}), 'b': 2})
+    >>> n = Mdict({'a': Mdict({'x': 2, 'y': 1}), 'c': 3})
+    >>> m - n == {'b': 2}, m & n == {'a': {'x': 1}}, m | n == {'a': {'x': 2, 'y': 1}, 'b': 2, 'c': 3}
+    (True, True, True)
+
+    Untouched subtrees are shared, and depth is no limit:
+    >>> (m + Mdict(b=1))['a'] is m['a']
+    True
+    >>> deep = leaf = Mdict(x=1)
+    >>> for i in range(5000): deep = Mdict(a=deep)
+    >>> total = deep + deep
+    >>> while 'a' in total: total = total['a']
+    >>> total
+    Mdict({'x': 2})
     """
 
     #With any "meta"-type, one must define a base-case that informs how one should perform grouping.
@@ -46,21 +143,7 @@ class Mdict(Counter):
         >>> m + m + 1 == {'a': {'a':2, 'b':4}, None: 1}
         True
         """
-        try: # need to add (union) of keys, and then recurse into values of common keys
-            return Mdict(Counter.__add__(self, other)) #Counter.__add__(self, other)
-        except TypeError: #must've been an integer for other
-            return Mdict(Counter.__add__(self, Counter({None: other})))
-    
-        #    self += set(other.keys()) #base case for group
-#
-##        except AttributeError: #no keys() method
-##            try:
-##                self[None] += other
-##            except TypeError(other):
-##                print other + " must be integer."
-
-    #def __iadd__(self, other):
-        
+        return _merge(self, other, lambda x, y: x + y, True, True)
 
     def __radd__(self, other):
         """Add int to group.
@@ -71,7 +154,303 @@ class Mdict(Counter):
         """
         #print self,other
         return self + other
-                
+
+    def __sub__(self, other):
+        """Subtract counts, with recursion.  Keeps only positive counts."""
+        return _merge(self, other, lambda x, y: x - y, True, False)
+
+    def __and__(self, other):
+        """Minimum of counts under keys in both, with recursion."""
+        return _merge(self, other, min, False, True)
+
+    def __or__(self, other):
+        """Maximum of counts, with recursion."""
+        return _merge(self, other, max, True, True)
+
+
+class _Last(object):
+    """Sorts after anything, so paths + (_LAST,) bisects to the end of the paths beginning with paths."""
+
+    __slots__ = []
+
+    def __lt__(self, other): return False
+    def __le__(self, other): return self is other
+    def __gt__(self, other): return self is not other
+    def __ge__(self, other): return True
+
+_LAST = _Last()
+
+def _column(values):
+    """Value column from a list:  a numpy array when numpy imports, so that totals, scaling and sums
+    of the same paths run as array operations, else the list itself."""
+    if numpy is None: return values
+    return numpy.array(values) if values else numpy.zeros(0, int)
+
+def _leaves(values):
+    """Value column as a list of plain Python values."""
+    if numpy is None: return values
+    return values.tolist()
+
+
+class FlatMdict(object):
+    """Mdict as two columns:  sorted tuple paths to each leaf, and the leaf values (a numpy array
+    when numpy imports, else a list).  Lookups and subtrees are a bisect away, and totals, sums and
+    scaling work on the value column instead of walking nested dicts.
+
+    >>> m = Mdict({'a': Mdict({'x': 1, 'y': 2}), 'b': 3})
+    >>> f = FlatMdict.from_mdict(m)
+    >>> f.paths, list(f.values)
+    ([('a', 'x'), ('a', 'y'), ('b',)], [1, 2, 3])
+    >>> f.to_mdict() == m, f['a', 'y'], f.total(), f.total(('a',))
+    (True, 2, 6, 3)
+    >>> f.subtree(('a',)).to_mdict() == m['a'], f.total(('c',))
+    (True, 0)
+    >>> f.subtree(('b',))     #a leaf:  use f['b',]
+    Traceback (most recent call last):
+    KeyError: "('b',) is a leaf"
+
+    >>> list((f + f.scale(2)).values)
+    [3, 6, 9]
+    >>> g = f + FlatMdict([(('a', 'z'), 5), (('b',), 1)])
+    >>> g.to_mdict() == m + Mdict({'a': Mdict(z=5), 'b': 1})
+    True
+    """
+
+    __slots__ = ['paths', 'values']
+
+    def __init__(self, items=()):
+        """Make from (path, value) pairs.  Values of repeated paths are added."""
+        paths, values = [], []
+        for path, value in sorted(items):
+            if paths and paths[-1] == path: values[-1] += value
+            else:
+                paths.append(path)
+                values.append(value)
+        self.paths, self.values = paths, _column(values)
+
+    def _from_columns(cls, paths, values):
+        """Make from sorted columns, without copying them."""
+        flat = cls.__new__(cls)
+        flat.paths, flat.values = paths, values
+        return flat
+    _from_columns = classmethod(_from_columns)
+
+    def from_mdict(cls, m):
+        """Flatten m, any depth, into paths of its leaves.  Empty subtrees have no leaves, so are left out."""
+        items, stack = [], [((), m)]
+        while stack:
+            prefix, tree = stack.pop()
+            for key, value in tree.iteritems():
+                if isinstance(value, dict): stack.append((prefix + (key,), value))
+                else: items.append((prefix + (key,), value))
+        items.sort()
+        return cls._from_columns([path for path, value in items], _column([value for path, value in items]))
+    from_mdict = classmethod(from_mdict)
+
+    def to_mdict(self):
+        """Return the nested Mdict."""
+        root = Mdict()
+        last, trees = (), [root]    #path to, and subtrees along, the last leaf's parent
+        for path, value in izip(self.paths, _leaves(self.values)):
+            shared = 0  #as paths are sorted, subtrees of the last path can be reused up to where they differ
+            while shared < len(last) and shared < len(path) - 1 and last[shared] == path[shared]: shared += 1
+            del trees[shared + 1:]
+            for key in path[shared:-1]:
+                trees.append(trees[-1].setdefault(key, Mdict()))
+            trees[-1][path[-1]] = value
+            last = path[:-1]
+        return root
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        """Iterate over (path, value) pairs, in path order."""
+        return izip(self.paths, _leaves(self.values))
+
+    def __getitem__(self, path):
+        i = bisect_left(self.paths, path)
+        if i == len(self.paths) or self.paths[i] != path: raise KeyError(path)
+        return _leaves(self.values[i:i + 1])[0]
+
+    def _range(self, prefix):
+        """Return (lo, hi) indexes of the paths beginning with prefix."""
+        return bisect_left(self.paths, prefix), bisect_left(self.paths, prefix + (_LAST,))
+
+    def subtree(self, prefix):
+        """Return FlatMdict of the leaves under prefix, with prefix taken off their paths.
+        Raises KeyError if prefix is the path of a leaf."""
+        lo, hi = self._range(prefix)
+        if prefix and lo < hi and self.paths[lo] == prefix: raise KeyError("%r is a leaf" % (prefix,))
+        n = len(prefix)
+        return self._from_columns([path[n:] for path in self.paths[lo:hi]], self.values[lo:hi])
+
+    def total(self, prefix=()):
+        """Sum of the leaves under prefix."""
+        lo, hi = self._range(prefix)
+        if numpy is not None: return self.values[lo:hi].sum().item()
+        return sum(self.values[lo:hi])
+
+    def scale(self, factor):
+        """Return copy with every leaf multiplied by factor."""
+        if numpy is not None: return self._from_columns(self.paths, self.values * factor)
+        return self._from_columns(self.paths, [value * factor for value in self.values])
+
+    def __add__(self, other):
+        """Add leaves of the same path.  Values are added column to column when both have the same
+        paths, else paths are merged in one pass and each side's values put at their merged places."""
+        a, b = self.paths, other.paths
+        av, bv = self.values, other.values
+        if a == b:
+            if numpy is not None: return self._from_columns(a, av + bv)
+            return self._from_columns(a, map(operator.add, av, bv))
+        paths, ia, ib, i, j = [], [], [], 0, 0  #merged paths, and where each of a and b went in them
+        while i < len(a) and j < len(b):
+            if a[i] < b[j]:
+                ia.append(len(paths))
+                paths.append(a[i])
+                i += 1
+            elif a[i] == b[j]:
+                ia.append(len(paths))
+                ib.append(len(paths))
+                paths.append(a[i])
+                i, j = i + 1, j + 1
+            else:
+                ib.append(len(paths))
+                paths.append(b[j])
+                j += 1
+        ia.extend(xrange(len(paths), len(paths) + len(a) - i)); paths.extend(a[i:])
+        ib.extend(xrange(len(paths), len(paths) + len(b) - j)); paths.extend(b[j:])
+        if numpy is not None:
+            values = numpy.zeros(len(paths), numpy.result_type(av, bv))
+            values[ia] = av
+            values[ib] += bv     #positions within ib are distinct, so += adds each once
+            return self._from_columns(paths, values)
+        values = [0] * len(paths)
+        for k, value in izip(ia, av): values[k] = value
+        for k, value in izip(ib, bv): values[k] += value
+        return self._from_columns(paths, values)
+
+
+class FrozenMdict(Mdict):
+    """Mdict that can't be changed, so can be hashed and shared.  Made by Interner.intern.
+
+    >>> f = FrozenMdict(a=1)
+    >>> f['a'] = 2
+    Traceback (most recent call last):
+    TypeError: FrozenMdict can't be changed
+    >>> hash(f) == hash(FrozenMdict(a=1))
+    True
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._interner = None   #Interner whose table holds self
+        self._hash = None
+
+    def _frozen(self, *args, **kwargs):
+        raise TypeError("FrozenMdict can't be changed")
+    __setitem__ = __delitem__ = update = subtract = clear = pop = popitem = setdefault = _frozen
+
+    def __hash__(self):
+        if self._hash is None: self._hash = hash(frozenset(self.iteritems()))
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other: return True
+        if isinstance(other, FrozenMdict) and other._interner is self._interner is not None:
+            return False    #interned by the same table:  equal only if the same object
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class Interner(object):
+    """Table of FrozenMdicts:  interning equal trees gives the same object, down to every subtree.
+    Sums of interned trees are kept in a cache of the last size pairs added.
+
+    >>> table = Interner()
+    >>> t = table.intern(Mdict(x=Mdict(a=1, b=2), y=Mdict(a=1, b=2), z=3))
+    >>> t['x'] is t['y'], len(table), table.intern(Mdict(a=1, b=2)) is t['x']
+    (True, 2, True)
+    >>> s = table.add(t, t)
+    >>> s == {'x': {'a': 2, 'b': 4}, 'y': {'a': 2, 'b': 4}, 'z': 6}, s['x'] is s['y']
+    (True, True)
+    >>> table.add(t, t) is s, table.add(t, 1) == t + 1
+    (True, True)
+    """
+
+    __slots__ = ['table', 'cache', 'size']
+
+    def __init__(self, size=4096):
+        self.table = {}     #{frozenset of (key, value or id of subtree, is subtree): FrozenMdict}
+        self.cache = OrderedDict()  #{(id(a), id(b)): interned a + b}, least recently used first
+        self.size = size    #pairs kept in cache
+
+    def __len__(self):
+        return len(self.table)
+
+    def clear(self):
+        self.table.clear()
+        self.cache.clear()
+
+    def _canonical(self, items):
+        """Return the interned FrozenMdict of (key, value) items whose subtrees are all interned."""
+        key = frozenset([(k, id(v), True) if isinstance(v, dict) else (k, v, False) for k, v in items])
+        tree = self.table.get(key)
+        if tree is None:
+            tree = self.table[key] = FrozenMdict(items)
+            tree._interner = self
+        return tree
+
+    def intern(self, tree):
+        """Return the interned FrozenMdict equal to tree (an int counts as {None: int}).
+        Only subtrees not interned yet are visited, children before parents."""
+        tree = _tree(tree)
+        if getattr(tree, '_interner', None) is self: return tree
+        done, stack = {}, [(tree, False)]   #done:  {id(subtree): interned}
+        while stack:
+            t, ready = stack.pop()
+            if ready:
+                done[id(t)] = self._canonical([(k, done.get(id(v), v)) for k, v in t.iteritems()])
+                continue
+            stack.append((t, True))
+            for v in t.itervalues():
+                if isinstance(v, dict) and getattr(v, '_interner', None) is not self and id(v) not in done:
+                    stack.append((v, False))
+        return done[id(tree)]
+
+    def add(self, a, b):
+        """Return interned a + b.  Sums of subtree pairs are looked up in, and added to, the cache,
+        so a pair already added isn't walked again."""
+        a, b = self.intern(a), self.intern(b)
+        cache, done = self.cache, {}    #done holds sums of this call, which the cache may have let go
+        stack = [(a, b, False)]
+        while stack:
+            x, y, ready = stack.pop()
+            pair = id(x), id(y)
+            if pair in done: continue
+            if pair in cache:
+                done[pair] = cache[pair] = cache.pop(pair)  #move to most recently used
+                continue
+            if not ready:
+                stack.append((x, y, True))
+                for k in x.viewkeys() & y.viewkeys():
+                    u, v = x[k], y[k]
+                    if isinstance(u, dict) or isinstance(v, dict):
+                        stack.append((self.intern(u), self.intern(v), False))
+                continue
+            items = []
+            for k in x.viewkeys() | y.viewkeys():
+                u, v = x.get(k), y.get(k)
+                if u is None or v is None: value = v if u is None else u
+                elif isinstance(u, dict) or isinstance(v, dict): value = done[id(self.intern(u)), id(self.intern(v))]
+                else: value = u + v
+                if (value if isinstance(value, dict) else value > 0): items.append((k, value))
+            done[pair] = cache[pair] = self._canonical(items)
+            if len(cache) > self.size: cache.popitem(last=False)
+        return done[id(a), id(b)]
 
 
 if __name__ == "__main__":
@@ -10,6 +10,8 @@
 #separate add_edge(h,t) function
 #use logging.debug to record all reads, logging.info to record all writes, logging.error to record TypeError issues, logging.critical for assertions...?
 
+import random, re
+
 from graph import *
 from bag import *
 
@@ -18,17 +20,42 @@ _DEBUG = True
 NodeBaseType = IntegerBag
 FlowType = IntegerBag
 
+SAMPLE_STATS = {'hits': 0, 'misses': 0}    #Node sampling population cache use
+
+BLOCKSIZE = 1 << 16     #bytes FileSource reads at a time
+#FileSource.filter as a str.translate table:  alphabetic to uppercase, everything else to space
+FILTER_TABLE = ''.join([c.isalpha() and c.upper() or ' ' for c in map(chr, range(256))])
+_SPACES = re.compile(' *')     #FileSource._wait:  run of spaces at the cursor
+
 
 class Node(reverse_edge_mixin, WVertex, NodeBaseType): #order needed for Vertex.discard to override bag.discard
     """Node in a flow network."""
 
-    __slots__ = ['reverse', 'flow_out', 'last_tick']
+    __slots__ = ['reverse', 'flow_out', 'last_tick', '_sample', '_rsample']
 
     def __init__(self, network, id, init={}):
         self.flow_out = FlowType()
+        self._sample = self._rsample = None  #cached sampling populations of self and self.reverse, see _pick
         super(Node, self).__init__(network, id, init)  #parent class should call Node.__setitem__ to add Nodes to Network if necessary.
         self.reverse = NodeBaseType(self.reverse)
 
+    def _blank(cls, network, id):
+        """Return new edgeless node without going through __init__, for bulk builders (see generate.py).
+        Subclasses holding more state must override this.
+
+        >>> n = Network()
+        >>> dict.__setitem__(n, 1, Node._blank(n, 1))
+        >>> n[1][2] = 3; n._validate(); print n
+        {1: 0 {2: 3}, 2: 0 {}}
+        """
+        node = cls.__new__(cls)
+        node._graph, node._id = network, id
+        node.flow_out, node.reverse = FlowType.__new__(FlowType), NodeBaseType.__new__(NodeBaseType)
+        node._sample = node._rsample = None
+        return node
+
+    _blank = classmethod(_blank)
+
     def update(self, sinks, capacity=1):
         """Add sinks to node.  If sinks is type Node, then add Node energy too.
 
@@ -44,10 +71,55 @@ class Node(reverse_edge_mixin, WVertex, NodeBaseType): #order needed for Vertex.
     add = update
     __getitem__ = NodeBaseType.__getitem__
 
+    def __setitem__(self, sink, capacity):
+        """Set capacity to sink, invalidating cached sampling populations."""
+        graph = self._graph
+        journal = graph.journal
+        if journal is not None and journal._edits is not None:    #tick in progress
+            journal._edits.append((self, sink, self[sink], sink not in graph))
+        if graph._dirty is not None: graph._dirty.add(self._id)
+        super(Node, self).__setitem__(sink, capacity)
+        self._sample = None
+        tail = dict.get(graph, sink)
+        if tail is None: graph[sink]    #create sink node, which has no cached sample yet
+        elif tail._rsample is not None: tail._rsample = None
+
     def __delitem__(self, sink):
         """Removes outgoing sink and clears any associated flow."""
+        graph = self._graph
+        journal = graph.journal
+        if journal is not None and journal._edits is not None:
+            journal._edits.append((self, sink, self[sink], False))
+        if graph._dirty is not None: graph._dirty.add(self._id)
         super(Node, self).__delitem__(sink)
         self.flow_out.discard(sink)
+        self._sample = None
+        tail = dict.get(graph, sink)
+        if tail is not None and tail._rsample is not None: tail._rsample = None
+
+    def _pick(self, count, reverse=False):
+        """Return bag of count random edges (from self.reverse if reverse is set), like
+        self.pick(count, False) and with the same random choices, but the population
+        to sample from is only rebuilt after capacities change.
+
+        >>> n = Network({1: {2: 2, 3: 1}})
+        >>> SAMPLE_STATS['hits'] = SAMPLE_STATS['misses'] = 0
+        >>> n[1]._pick(3), n[1]._pick(5), n[1]._pick(1).size
+        ({2: 2, 3: 1}, {2: 2, 3: 1}, 1)
+        >>> n[1][3] = 0
+        >>> n[1]._pick(5), n[3]._pick(1, True), SAMPLE_STATS
+        ({2: 2}, {}, {'hits': 2, 'misses': 3})
+        """
+        population = self._rsample if reverse else self._sample
+        if population is None:
+            SAMPLE_STATS['misses'] += 1
+            population = []
+            for key, n in (self.reverse if reverse else self).iteritems():  #same order as IntegerBag.itereach
+                population.extend([(key, n >= 0 and 1 or -1)] * abs(n))
+            if reverse: self._rsample = population
+            else: self._sample = population
+        else: SAMPLE_STATS['hits'] += 1
+        return IntegerBag(random.sample(population, min(abs(count), len(population))))
 
     def _push(self, bits, tick):
         """Advance node 1 time increment. Returns amount of energy remaining.
@@ -76,12 +148,45 @@ class Node(reverse_edge_mixin, WVertex, NodeBaseType): #order needed for Vertex.
         self.last_tick = tick       #XXX would like to set last_tick and clear flow only if paths!=[]
         self.flow_out.clear()       #clear old flow values
         if bits >= 0:   #forward flow
-            self.flow_out += self.pick(bits, False) #slower than necessary if bits = self.size
+            self.flow_out += self._pick(bits) #slower than necessary if bits = self.size
             return bits - self.flow_out.size
         else:           #backward flow
-            self.flow_out -= self.reverse.pick(abs(bits), False) #pick returns negative values if given negative count
+            self.flow_out -= self._pick(abs(bits), True)
             return bits + self.flow_out.size
 
+    def _deterministic(self, bits):
+        """True if _push(bits) will not depend on random choice (and has no outside effects).
+
+        >>> n = Network({1: {2: 1, 3: 2}, 2: {3: 5}})
+        >>> n[1]._deterministic(2), n[1]._deterministic(3), n[2]._deterministic(2)
+        (False, True, True)
+        """
+        population = self if bits >= 0 else self.reverse
+        return abs(bits) >= population.size or len(population) <= 1
+
+    def _mark(self):
+        """Return state outside the graph and energy (read position etc.) which _rewind(mark) restores.
+        Kept by journal.Journal for each node pushed on a tick."""
+        return None
+
+    def _rewind(self, mark): pass
+
+    def _wait(self, bits):
+        """Return number of coming ticks on which node won't move energy, None if it never will
+        (until its energy or edges change).  Used by Network._events to skip idle ticks.
+        Subclasses whose _push has outside effects must override this.
+
+        >>> n = Network({1: {2: 1}})
+        >>> n[1]._wait(1), n[2]._wait(1), n[2]._wait(-1)
+        (0, None, 0)
+        """
+        if (self if bits >= 0 else self.reverse): return 0
+        return None
+
+    def _skip(self, bits, count):
+        """Advance node over count ticks on which _wait says it's idle."""
+        self._push(bits, self._graph.ticks)     #an idle push only clears flow_out and sets last_tick, so once will do
+
     def _flow_in(self):
         """Return bag with incoming flow.
 
@@ -113,10 +218,53 @@ class Node(reverse_edge_mixin, WVertex, NodeBaseType): #order needed for Vertex.
     energy = property(_energy_read, _energy_write, None, "Energy at node. Faster to use network.energy[id]")
 
     def clear(self):
+        """Remove all edges, flow and energy of node, telling the journal and checkpoints as __delitem__ does.
+
+        >>> fn = '/tmp/network.ckpt'
+        >>> n = Network({1: {2: 2, 3: 1}})
+        >>> n.checkpoint(fn, True)
+        >>> n[1].clear(); n.checkpoint(fn)
+        >>> n2 = Network(); n2.restore(fn); print n2
+        {1: 0 {}, 2: 0 {}, 3: 0 {}}
+        """
+        g = self._graph
+        journal = g.journal
+        if journal is not None and journal._edits is not None:
+            journal._edits.extend([(self, sink, capacity, False) for sink, capacity in self.iteritems()])
+        if g._dirty is not None: g._dirty.add(self._id)
+        for sink in self:
+            g[sink]._rsample = None
+        self._sample = None
         super(Node, self).clear()
         self.flow_out.clear()
         self.energy = 0
 
+    def _getstate(self):
+        """Return picklable tuple of simulation state held on the node (energy is kept by Network).
+
+        >>> n = Network({1: {2: 3}})
+        >>> n[1]._getstate()
+        ({2: 3}, {}, None)
+        """
+        return (dict(self), dict(self.flow_out), getattr(self, 'last_tick', None))
+
+    def _setstate(self, state):
+        """Restore node from the tuple returned by _getstate.
+
+        >>> n = Network({1: {2: 3, 3: 1}})
+        >>> n[1]._setstate(({2: 1, 4: 2}, {2: 1}, 7))
+        >>> print n[1], n[1].flow_out, n[1].last_tick
+        0 {2: 1, 4: 2} {2: 1} 7
+        >>> n[2].reverse, n[3].reverse
+        ({1: 1}, {})
+        """
+        edges, flow, self.last_tick = state[:3]
+        for sink in [s for s in self if s not in edges]:
+            del self[sink]
+        for sink, capacity in edges.iteritems():
+            if self[sink] != capacity: self[sink] = capacity
+        self.flow_out = FlowType(flow)
+
     def __str__(self):
         """Returns string with energy level and arc info.
         >>> n = Network()
@@ -142,9 +290,16 @@ class Node(reverse_edge_mixin, WVertex, NodeBaseType): #order needed for Vertex.
         >>> n[1]._validate()
         Traceback (most recent call last):
         AssertionError: flow encountered on non-existent edge
+        >>> n[1].flow_out.clear()
+        >>> dict.__setitem__(n[1], 2, 0.5)  #as bulk builders write
+        >>> n[1]._validate()
+        Traceback (most recent call last):
+        AssertionError: invalid capacity 0.5 to 2
         """
         for dest in self.flow_out:
             assert dest in self or dest in self.reverse, "flow encountered on non-existent edge"
+        for sink, capacity in self.iteritems():
+            assert isinstance(capacity, (int, long)) and capacity, "invalid capacity %r to %r" % (capacity, sink)
         super(Node, self)._validate()
 
 
@@ -193,6 +348,57 @@ class Source(Node):  #Crown
             super(Source, self)._push(bits, tick)
             return -self.flow_out.size or bits
 
+    def _deterministic(self, bits): return True  #always pushes to all edges
+
+
+class PeriodicSource(Source):
+    """Source that pushes on one tick out of every period, starting with the first, and idles in between.
+
+    >>> n = Network({1: {2: 1}})
+    >>> n.attach(PeriodicSource, 'clock', 3)
+    'clock'
+    >>> n['clock'][1] = 2
+    >>> n(7); print n
+    {1: 2 {2: 1}, 2: 4 {}, 'clock': 2 {1: 2}}
+    >>> n['clock'].countdown
+    2
+    """
+
+    __slots__ = ['period', 'countdown']
+
+    def __init__(self, network, id, period, init={}):
+        self.period = period
+        self.countdown = 0      #idle ticks left before next push
+        super(PeriodicSource, self).__init__(network, id, init)
+
+    def _push(self, bits, tick):
+        if self.countdown:
+            self.countdown -= 1
+            self.flow_out.clear()
+            return bits
+        self.countdown = self.period - 1
+        return super(PeriodicSource, self)._push(bits, tick)
+
+    def _deterministic(self, bits): return False  #countdown isn't part of the state Network._converge compares
+
+    def _wait(self, bits):
+        return self.countdown or super(PeriodicSource, self)._wait(bits)
+
+    def _skip(self, bits, count):
+        if count > self.countdown: Source._push(self, bits, self._graph.ticks)  #pushes in between had no edges to use
+        else: self.flow_out.clear()
+        self.countdown = (self.countdown - count) % self.period
+
+    def _mark(self): return self.countdown
+    def _rewind(self, mark): self.countdown = mark
+
+    def _getstate(self):
+        return super(PeriodicSource, self)._getstate() + (self.countdown,)
+
+    def _setstate(self, state):
+        super(PeriodicSource, self)._setstate(state)
+        self.countdown = state[3]
+
 
 class FileSource(Source): #cannot multiple inherit from file also
     """Special node that produces flow to other nodes from file source.
@@ -227,18 +433,33 @@ class FileSource(Source): #cannot multiple inherit from file also
     #perhaps a way to make source.energy automatic: network gets to say when it wants input
     #  (by sending energy to it? NO: by retrieving its out_flow (i.e. downstream neuron has expectation>reality?).)
 
-    __slots__ = ['source']
+    __slots__ = ['source', '_buffer', '_cursor']
 
     def __init__(self, network, source_file, init={}):
         """Creates a FileSource node with the name of the source file as it's node id."""
         if not isinstance(source_file, file): raise TypeError("Must be file type")
         self.source = (not source_file.closed) and source_file or open(source_file.name, 'r')
+        self._buffer, self._cursor = '', 0  #filtered block read ahead from source, and next position in it
         super(FileSource, self).__init__(network, source_file.name, init)
         #perhaps self.energy == self.source.size
 
     def _pull(self):
-        bit_id = self.filter(self.source.read(1)) #read one character at a time
-        return bit_id or self.source.close() #XXX relies on close() returning None
+        """Return next filtered character, reading and filtering a block at a time.
+
+        >>> f = file('/tmp/network.tmp', 'w'); f.write('a1 Z!'); f.close()
+        >>> n = Network()
+        >>> s = n[n.attach(FileSource, open('/tmp/network.tmp'))]
+        >>> [s._pull() for i in range(6)]
+        ['A', ' ', ' ', 'Z', ' ', None]
+        """
+        try:
+            bit_id = self._buffer[self._cursor]
+        except IndexError:  #cheaper than a length check on every call
+            self._buffer, self._cursor = self.source.read(BLOCKSIZE).translate(FILTER_TABLE), 0
+            if not self._buffer: return self.source.close() #XXX relies on close() returning None
+            bit_id = self._buffer[0]
+        self._cursor += 1
+        return bit_id
 
     def _push(self, bits, tick):
         """Reads information from source, propagates to downstream nodes."""
@@ -253,12 +474,73 @@ class FileSource(Source): #cannot multiple inherit from file also
             return bits        #XXX could return filesize - 1
         else: return 0  #EOF:  nothing left for this source
 
+    def _deterministic(self, bits): return False  #outside input
+
+    def _wait(self, bits):
+        """Whitespace already read ahead is idle ticks.
+
+        >>> f = file('/tmp/network.tmp', 'w'); f.write('a   b'); f.close()
+        >>> n = Network()
+        >>> s = n[n.attach(FileSource, open('/tmp/network.tmp'))]
+        >>> s._wait(1), s._pull(), s._wait(1)
+        (0, 'A', 3)
+        """
+        cursor = self._cursor
+        return _SPACES.match(self._buffer, cursor).end() - cursor   #scan in place; slicing would copy the block
+
+    def _skip(self, bits, count):
+        self._cursor += count
+        self.flow_out.clear()
+
+    def _mark(self):
+        position = None if self.source.closed else self.source.tell()
+        return (self._buffer, self._cursor, position)
+
+    def _rewind(self, mark):
+        self._buffer, self._cursor, position = mark
+        if position is None:
+            self.source.close()
+        else:
+            if self.source.closed: self.source = open(self.source.name, 'r')
+            if self.source.tell() != position: self.source.seek(position)
+
     def filter(self, bit_id):
         """Converts alphabetic characters to uppercase, empty string to None, all others returns a space."""
         if bit_id.isalpha(): return bit_id.upper()
         elif not bit_id: return None #EOF
         else: return " " #all non-alphabetic treat as space
 
+    def _getstate(self):
+        """Node state plus read position in source file (None once file is exhausted).
+
+        >>> fn = '/tmp/network.tmp'
+        >>> f = file(fn, 'w'); f.write('ab cd'); f.close()
+        >>> n = Network()
+        >>> n.attach(FileSource, open(fn))
+        '/tmp/network.tmp'
+        >>> n(2); n.checkpoint('/tmp/network.ckpt')
+        >>> n(100); n[fn].source.closed
+        True
+        >>> n.restore('/tmp/network.ckpt')
+        >>> n[fn].source.tell(), n.ticks
+        (2, 2)
+        >>> n(100); print n
+        {'/tmp/network.tmp': 0 {'A': 1, 'B': 1, 'C': 1, 'D': 1}, 'A': 1 {}, 'B': 1 {}, 'C': 1 {}, 'D': 1 {}}
+        """
+        if self.source.closed: position = None
+        else: position = self.source.tell() - (len(self._buffer) - self._cursor)  #less what's read ahead
+        return super(FileSource, self)._getstate() + (position,)
+
+    def _setstate(self, state):
+        super(FileSource, self)._setstate(state)
+        position = state[3]
+        if position is None:
+            self.source.close()
+        else:
+            if self.source.closed: self.source = open(self.source.name, 'r')
+            self.source.seek(position)
+        self._buffer, self._cursor = '', 0
+
     def __del__(self):
         #super(FileSource, self).__del__()
         self.energy = 0
@@ -279,43 +561,99 @@ class KeySource(FileSource):
     '<stdin>'
     >>> print n
     {'<stdin>': 1 {}}
+
+    The terminal is put in cbreak mode on the first tick and restored by stop(),
+    on leaving a with block, or if an exception occurs during a tick.  Each tick
+    serves one key; all keys that are ready are read at once.  Any terminal will do:
+    >>> import os, pty, select
+    >>> master, slave = pty.openpty()
+    >>> n = Network()
+    >>> keys = n[n.attach(KeySource, os.fdopen(slave, 'r'))]
+    >>> with keys:
+    ...     n()     #nothing typed yet:  idle tick
+    ...     written = os.write(master, 'ab~c')
+    ...     ready = select.select([slave], [], [], 5)   #wait for the keys to reach the terminal
+    ...     n(5)
+    >>> print n
+    {'<fdopen>': 0 {'A': 1, 'B': 1}, 'A': 1 {}, 'B': 1 {}}
+    >>> KeySource.tty.tcgetattr(slave) == keys._save_attr
+    True
     """
 
-    import sys, tty, select
+    import os, sys, tty, select
 
-    __slots__ = ['_save_attr']
+    __slots__ = ['_save_attr', '_raw', '_ended']
 
     def __init__(self, network, tty_source=sys.stdin, init={}):
         if not tty_source.isatty(): raise TypeError("KeySource must be be passed a tty.")
         self._save_attr = KeySource.tty.tcgetattr(tty_source)
+        self._raw = False       #terminal in cbreak mode
+        self._ended = False     #stop key seen
         super(KeySource, self).__init__(network, tty_source, init) #XXX skip FileSource init which opens stdin with error
 
     def _pull(self):
-        tty, select = KeySource.tty, KeySource.select.select
-        newattr = self._save_attr[:]
-        newattr[3] &= ~tty.ECHO & ~tty.ICANON
-        tty.tcsetattr(self.source, tty.TCSANOW, newattr)
-        if select([self.source], [], [], 0)[0]:  #while select...: self.flow_in[bit]+=1 --read all characters that are ready, not just 1
-            bit_id = self.source.read(1)
-            if bit_id == '~': #special key to indicate "stop this source"
+        try:
+            bit_id = self._buffer[self._cursor]
+        except IndexError:
+            if self._ended:
                 self.stop()   #close this source
                 return 0
-            else: bit_id = self.filter(bit_id)
-        else:
-            bit_id = ' '
+            self.start()
+            if not KeySource.select.select([self.source], [], [], 0)[0]: return ' '
+            keys = KeySource.os.read(self.source.fileno(), BLOCKSIZE) #read all characters that are ready, not just 1
+            if not keys:    #EOF:  give the terminal back, as the stop key does
+                self.stop()
+                return None
+            end = keys.find('~') #special key to indicate "stop this source"
+            if end >= 0: keys, self._ended = keys[:end], True
+            if not keys: return self._pull()
+            self._buffer, self._cursor = keys.translate(FILTER_TABLE), 0
+            bit_id = self._buffer[0]
+        self._cursor += 1
         return bit_id
 
     def _push(self, bits, tick):
-        bits = super(KeySource, self)._push(bits, tick)
-        self.stop()
-        return bits
+        done = False
+        try:
+            result = super(KeySource, self)._push(bits, tick)
+            done = True
+            return result
+        finally:
+            if not done: self.stop()  #give the terminal back whatever was raised, even KeyboardInterrupt
+
+    def start(self):
+        """Put terminal in cbreak mode (no echo, keys available without waiting for return)."""
+        if self._raw: return
+        tty = KeySource.tty
+        newattr = self._save_attr[:]
+        newattr[3] &= ~tty.ECHO & ~tty.ICANON
+        tty.tcsetattr(self.source, tty.TCSANOW, newattr)
+        self._raw = True
 
     def stop(self):
-        KeySource.tty.tcsetattr(self.source, KeySource.tty.TCSADRAIN, self._save_attr)
+        """Restore terminal mode saved when source was created."""
+        if getattr(self, '_raw', False) and not self.source.closed:
+            KeySource.tty.tcsetattr(self.source, KeySource.tty.TCSADRAIN, self._save_attr)
+        self._raw = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    _getstate, _setstate = Node._getstate.im_func, Node._setstate.im_func  #terminal input can't be rewound
+    _mark, _rewind = Node._mark.im_func, Node._rewind.im_func
 
     __del__ = stop
 
 
+def print_writer(sink_id, tick, bits):
+    """Default Sink writer:  all bits sent to screen."""
+    print "%s: %s" % (sink_id, bits)
+
+
 class Sink(Node):  #root
     """Special node type.  Energy leaves network out of here.
 
@@ -338,13 +676,22 @@ class Sink(Node):  #root
 
     #XXX what if energy is negative?
 
-    __slots__ = []
+    __slots__ = ['writer']
+
+    def __init__(self, network, id, init={}, writer=None):
+        """Output goes to writer(sink id, tick, bits), printed to screen by default.  See output module for others."""
+        self.writer = writer or print_writer
+        super(Sink, self).__init__(network, id, init)
 
     def _push(self, bits, tick):
         assert bits
-        print "%s: %s" % (self._id, bits)  #all bits sent to screen
+        self.writer(self._id, tick, bits)  #all bits sent out
         return 0
 
+    def _deterministic(self, bits): return False  #output can't be skipped
+
+    def _wait(self, bits): return 0
+
     def _validate(self):
         assert len(self.flow_out) == 0, "Unexpected flow_out: %s" % self.flow_out()
         assert self.out_degree() == 0
@@ -356,7 +703,7 @@ class Network(Graph):
     #XXX need way to synchronize changes to Network.energy with graph; i.e. n.energy[non-existent-node] += x.
     #perhaps have Network derive from bag and have the graph be an attribute of the network; i.e. n.graph[1][2]==capacity, n[1][2]==flow
 
-    __slots__ = ['energy', 'ticks']
+    __slots__ = ['energy', 'ticks', 'converge', 'events', 'recorder', 'journal', '_saved', '_dirty']
 
     def __init__(self, init={}, VertexType=Node):
         """Create the network, optionally initializing from other graph type.
@@ -373,6 +720,12 @@ class Network(Graph):
         if not issubclass(VertexType, Node): raise TypeError("Invalid node type")
         self.energy = FlowType()   #stores energy values at each node
         self.ticks = 0           #number of network clock ticks since creation
+        self.converge = 0        #longest cycle (in ticks) to detect and fast-forward over, 0 to disable
+        self.events = False      #skip over ticks on which no node acts, see _events
+        self.recorder = None     #per-tick metrics recorder, see recorder.Recorder
+        self.journal = None      #record of changes for undoing ticks, see journal.Journal
+        self._saved = None       #(path, node ids, energy, RNG state) of last checkpoint, for incremental saves
+        self._dirty = None       #ids of nodes whose state may have changed since the last checkpoint, once there is one
         super(Network, self).__init__(init, VertexType) #will call update()
 
     def __call__(self, ticks=1):
@@ -399,14 +752,132 @@ class Network(Graph):
         >>> assert n.energy == {3: 13}
         >>> n.ticks
         9
+
+        Negative ticks undo ticks recorded by a journal.Journal.
+        >>> n(-1)
+        Traceback (most recent call last):
+        ValueError: Undoing ticks needs a journal, see journal.Journal
+        """
+        if ticks < 0:
+            if self.journal is None: raise ValueError("Undoing ticks needs a journal, see journal.Journal")
+            return self.journal.undo(-ticks)
+        if self.journal is None:    #the journal needs every tick simulated
+            if self.converge:
+                return self._converge(ticks)
+            if self.events:
+                return self._events(ticks)
+        tick = self._tick if self.recorder is None else self.recorder._tick
+        for tic in xrange(ticks):
+            tick()
+
+    def _converge(self, ticks):
+        """Advance network for ticks, skipping over repeated states.  The state (energy plus flow)
+        is hashed before each tick; once a state recurs with only deterministic ticks in between,
+        whole cycles are skipped by adding their tick count, and the last cycle is re-run so
+        last_tick and flow_out are current.  Enabled by setting converge to the longest cycle to look for.
+
+        A fixed point returns at once:
+        >>> n = Network({1: {2: 1}})
+        >>> n.energy[1] = 3
+        >>> n.converge = 10
+        >>> n(10**7); n.ticks, n.energy
+        (3, {2: 3})
+
+        As does a periodic regime:
+        >>> n = Network({1: {2: 1}, 2: {3: 1}, 3: {1: 1}})
+        >>> n.energy[1] = 1
+        >>> n.converge = 10
+        >>> n(10**7 + 1); n.ticks, n.energy, n[3].last_tick
+        (10000001, {3: 1}, 9999998)
+
+        Ticks with random choices, outside input or sink output are always simulated.
         """
-        assert ticks>=0     #may desire ticks<0 to run in reverse
-        for tic in xrange(ticks):  #XXX active_nodes does not include nodes with flow but no energy.
-            active_nodes = [self[nid] for nid in self.energy] #XXX will add nodes that have no edges and cannot transfer flow
-            flow = self._push(active_nodes)
-            self._pull(active_nodes)
-            if flow: self.ticks += 1
-            #else: break
+        history, tic = {}, 0    #state key: (tic, self.ticks) when state was seen
+        tick = self._tick if self.recorder is None else self.recorder._tick
+        while tic < ticks:
+            if not all([self[nid]._deterministic(bits) for nid, bits in self.energy.iteritems()]):
+                history.clear()
+            else:
+                key = (frozenset(self.energy.iteritems()),
+                       frozenset([(nid, frozenset(node.flow_out.iteritems())) for nid, node in self.iteritems() if node.flow_out]))
+                if key in history:
+                    start_tic, start_ticks = history.pop(key)
+                    period = tic - start_tic
+                    cycles = (ticks - tic) // period - 1  #leave the last cycle to simulate
+                    if cycles > 0:
+                        self.ticks += cycles * (self.ticks - start_ticks)
+                        tic += cycles * period
+                    history.clear()
+                elif len(history) < self.converge:
+                    history[key] = (tic, self.ticks)
+                else: history.clear()
+            tick()
+            tic += 1
+
+    def _events(self, ticks):
+        """Advance network for ticks, jumping over stretches of ticks on which no node moves energy.
+        Before each tick every node with energy says how many ticks it will stay idle (_wait);
+        if all of them will, they skip together to the first tick one of them acts on.
+        Time taken grows with the number of ticks something happens on, not with ticks.
+        Ends in the same state as ticking one at a time.  Enabled by setting events.
+
+        Sparse input:
+        >>> fn = '/tmp/network.tmp'
+        >>> f = file(fn, 'w'); f.write('a' + ' ' * 10**6 + 'b c'); f.close()
+        >>> n = Network()
+        >>> n.attach(FileSource, open(fn))
+        '/tmp/network.tmp'
+        >>> n.events = True
+        >>> n(10**6); print n, n.ticks
+        {'/tmp/network.tmp': 1 {'A': 1}, 'A': 1 {}} 1
+        >>> n(10); print n, n.ticks, n['B'].last_tick
+        {'/tmp/network.tmp': 0 {'A': 1, 'B': 1, 'C': 1}, 'A': 1 {}, 'B': 1 {}, 'C': 1 {}} 3 3
+
+        Periodic output, matching a tick-by-tick run:
+        >>> def clocked(events):
+        ...     n = Network({1: {2: 1}, 2: {3: 1}})
+        ...     n.attach(PeriodicSource, 'clock', 1000)
+        ...     n['clock'][1] = 1
+        ...     n.events = events
+        ...     n(10**5 + 2)
+        ...     return str(n), n.ticks, n[2].last_tick
+        >>> clocked(True)
+        ("{1: 0 {2: 1}, 2: 1 {3: 1}, 3: 100 {}, 'clock': 1 {1: 1}}", 302, 299)
+        >>> clocked(True) == clocked(False)
+        True
+
+        Skipped ticks aren't seen by a recorder.
+        """
+        tick = self._tick if self.recorder is None else self.recorder._tick
+        tic = 0
+        while tic < ticks:
+            wake = ticks - tic  #ticks until some node acts, no more than are left
+            for nid, bits in self.energy.iteritems():
+                wait = self[nid]._wait(bits)
+                if wait is not None and wait < wake:
+                    wake = wait
+                    if not wake: break
+            if wake:
+                if self._dirty is not None: self._dirty.update(self.energy)
+                for nid, bits in self.energy.iteritems():
+                    self[nid]._skip(bits, wake)
+                tic += wake
+            else:
+                tick()
+                tic += 1
+
+    def _tick(self):
+        """Advance network one tick.  Returns amount of energy moved during the tick."""
+        #XXX active_nodes does not include nodes with flow but no energy.
+        active_nodes = [self[nid] for nid in self.energy] #XXX will add nodes that have no edges and cannot transfer flow
+        if self._dirty is not None: self._dirty.update(self.energy)   #nodes pushing are the ones whose state changes
+        journal = self.journal
+        if journal is not None: entry = journal._begin(active_nodes)
+        flow = self._push(active_nodes)
+        self._pull(active_nodes)
+        if flow: self.ticks += 1
+        if journal is not None: journal._end(entry)
+        return flow
 
     def _push(self, active_nodes):
         flow = 0
@@ -475,6 +946,7 @@ class Network(Graph):
         """
         #XXX haven't checked if everything done here...
         super(Network, self).__delitem__(key)
+        if self._dirty is not None: self._dirty.add(key)   #in case a node of the same id is added again
         self.energy.discard(key) #Note: may be called with list from discard() so do this last
 
     def display_energy(self):
@@ -504,6 +976,91 @@ class Network(Graph):
         self.energy.clear()
         self.ticks = 0
 
+    def checkpoint(self, path, full=False):
+        """Save simulation state (edges, energy, flow, ticks, source positions, RNG) to path.
+        Repeated checkpoints to the same path append only what changed since the last one:  the
+        nodes that ticked or had edges set or removed, nodes added or removed, changed energies,
+        and the RNG state if it moved.  Set full to rewrite the file with a complete snapshot,
+        needed after changing node state in other ways (flow_out, last_tick, etc.).
+        Nodes whose input can't be read again (runner.QueueSource) raise TypeError, writing nothing.
+
+        >>> fn = '/tmp/network.ckpt'
+        >>> n = Network({1: {2: 2, 3: 1}, 2: {1: 1, 3: 2}, 3: {1: 2}})
+        >>> n.energy[1] = 9
+        >>> n(3); n.checkpoint(fn, True)
+        >>> n(4); n.checkpoint(fn)
+        >>> saved = str(n), n.ticks
+        >>> n(20); after = str(n), n.ticks
+
+        Restoring into a fresh network resumes from the last checkpoint,
+        replaying exactly what the uninterrupted run did:
+        >>> n2 = Network()
+        >>> n2.restore(fn)
+        >>> (str(n2), n2.ticks) == saved
+        True
+        >>> n2(20); (str(n2), n2.ticks) == after
+        True
+        """
+        import cPickle, os, random
+        #the record is made before the file is opened, so a node that can't be saved (_getstate
+        #  raising TypeError) leaves the file as it was
+        rng_state, energy = random.getstate(), dict(self.energy)
+        rng = rng_state
+        if full or not self._saved or self._saved[0] != path or not os.path.exists(path):
+            record, mode = ('base', dict((nid, node._getstate()) for nid, node in self.iteritems()), energy), 'wb'
+        else:
+            old_ids, old_energy, old_rng = self._saved[1:]
+            ids = set(self)
+            states = dict((nid, self[nid]._getstate()) for nid in (self._dirty & ids) | (ids - old_ids))
+            new = set(energy.iteritems()) - set(old_energy.iteritems())
+            record = ('delta', states, list(old_ids - ids), dict(new), list(set(old_energy) - set(energy)))
+            if rng == old_rng: rng = None   #unchanged:  restore keeps the last one saved
+            mode = 'ab'
+        f = open(path, mode)
+        try:
+            cPickle.dump((record, self.ticks, rng), f, 2)
+        finally: f.close()
+        self._saved = (path, set(self), energy, rng_state)
+        self._dirty = set()
+
+    def restore(self, path):
+        """Reset network to the state last saved with checkpoint(path).
+        Nodes needing more than their id to construct (FileSource, etc.) must already be attached.
+        A record left incomplete by an interrupted write is ignored.
+
+        >>> n = Network()
+        >>> n.restore('/tmp/network.nonexistent')
+        Traceback (most recent call last):
+        IOError: [Errno 2] No such file or directory: '/tmp/network.nonexistent'
+        """
+        import cPickle, random
+        f = open(path, 'rb')
+        records = []
+        try:
+            while True:
+                try: records.append(cPickle.load(f))
+                except (EOFError, ValueError, cPickle.UnpicklingError): break
+        finally: f.close()
+        if not records or records[0][0][0] != 'base': raise ValueError("No checkpoint in %s" % path)
+        for record, ticks, rng in records:
+            if rng is not None: rng_state = rng
+            if record[0] == 'base':
+                nodes, energy = dict(record[1]), dict(record[2])
+            else:
+                nodes.update(record[1]); energy.update(record[3])
+                for nid in record[2]: del nodes[nid]
+                for nid in record[4]: del energy[nid]
+        for nid in [nid for nid in self if nid not in nodes]:
+            del self[nid]
+        for nid, state in nodes.iteritems():
+            self[nid]._setstate(state)
+        self.energy.clear()
+        self.energy.update(energy)
+        self.ticks = ticks
+        random.setstate(rng_state)
+        self._saved = (path, set(nodes), energy, rng_state)
+        self._dirty = set()
+
     def _validate(self):
         """Assert Network invariants.
 
@@ -527,10 +1084,120 @@ def run(net, count=10, interval=1):
     Use a network with a KeySource attached.  See KeySource doc on how to do that.
     """
     import time
-    for i in range(count):
-        net()
-        net.display()
-        time.sleep(interval)
+    try:
+        for i in range(count):
+            net()
+            net.display()
+            time.sleep(interval)
+    finally:    #give the terminal back even if interrupted
+        for node in net.itervalues():
+            if isinstance(node, KeySource): node.stop()
+
+
+_sweep_base = None  #(network or factory, checkpoint path, attribute defaults) in each worker, set by _sweep_init
+
+def _sweep_init(base, path, defaults):
+    """Pool initializer:  give the worker process the base network, and its own FileSource files,
+    as forked file objects would share one offset with every other process."""
+    global _sweep_base
+    _sweep_base = (base, path, defaults)
+    if path:
+        for node in base.itervalues():
+            if isinstance(node, FileSource) and node.source is not None and not node.source.closed:
+                node.source = open(node.source.name, 'r')
+
+def _sweep_run(task):
+    """Run one parameter set in a worker.  Returns (params, metrics)."""
+    import random
+    index, params, ticks = task
+    base, path, defaults = _sweep_base
+    if path:    #reset this worker's private copy of the base network
+        net = base
+        net.restore(path)   #seeks the worker's own files to the saved position
+        for key, value in defaults.iteritems():     #undo attributes set by the worker's last task
+            setattr(net, key, value)
+        for key, value in params.iteritems():
+            if key == 'energy':
+                net.energy.update(dict((nid, e - net.energy[nid]) for nid, e in value.iteritems()))
+            elif key == 'capacity':
+                for (head, tail), capacity in value.iteritems():
+                    net[head][tail] = capacity
+            else: setattr(net, key, value)
+    else:
+        net = base(**params)
+    random.seed(index)
+    sinks = [nid for nid, node in net.iteritems() if isinstance(node, Sink)]
+    metrics = {'flow': [], 'energy': [], 'sink': []}
+    for tic in xrange(ticks):
+        metrics['sink'].append(sum([net.energy[nid] for nid in sinks])) #what sinks emit this tick
+        metrics['flow'].append(net._tick())
+        metrics['energy'].append(net.total_energy)
+    metrics['ticks'] = net.ticks
+    return params, metrics
+
+def sweep(base, grid, ticks, processes=None):
+    """Run copies of a network for every parameter set in grid on a process pool, yielding
+    (params, metrics) as each run completes.  metrics holds per-tick lists of 'flow', total
+    'energy' and 'sink' output, plus the final 'ticks'.
+
+    base is either a Network, which workers are given when the pool starts and reset from an
+    on-disk checkpoint between runs, or a factory called as base(**params) to build each network.
+    Network attributes set by params are put back to the base's values before the next run.
+    grid maps parameter names to lists of values (all combinations are run) or is a list
+    of param dicts.  For a Network base, params are 'energy' ({nid: energy}),
+    'capacity' ({(head, tail): capacity}) or network attributes such as link_threshold.
+    Runs are seeded by their position in the grid, so results are reproducible.
+
+    >>> n = Network({1: {2: 1}, 2: {3: 1}})
+    >>> n.attach(Sink, 's')
+    's'
+    >>> n[3]['s'] = 1
+    >>> for params, m in sorted(sweep(n, {'energy': [{1: 1}, {1: 3}]}, 5, 2)):
+    ...     print params, m['sink'], m['flow']
+    {'energy': {1: 1}} [0, 0, 0, 1, 0] [1, 1, 1, 0, 0]
+    {'energy': {1: 3}} [0, 0, 0, 1, 1] [1, 2, 3, 2, 1]
+    >>> print n  #base network is left untouched
+    {1: 0 {2: 1}, 2: 0 {3: 1}, 3: 0 {'s': 1}, 's': 0 {}}
+
+    Each worker reads FileSources from its own copy of the file, leaving the base's where it was:
+    >>> f = file('/tmp/network.tmp', 'w'); f.write('ab' * BLOCKSIZE); f.close()
+    >>> n = Network()
+    >>> fn = n.attach(FileSource, open('/tmp/network.tmp'))
+    >>> n(8); n[fn].source.tell() == BLOCKSIZE
+    True
+    >>> runs = list(sweep(n, [{}, {}], 10, 2)); n[fn].source.tell() == BLOCKSIZE
+    True
+
+    Attributes set by one run don't carry over to the next run in the same worker:
+    >>> class Boosted(Network):
+    ...     __slots__ = ['boost']
+    ...     def _tick(self): return Network._tick(self) + self.boost
+    >>> n = Boosted({1: {2: 1}, 2: {1: 1}}); n.energy[1], n.boost = 1, 0
+    >>> [m['flow'] for params, m in sweep(n, [{'boost': 100}, {}, {}], 2, 1)]
+    [[101, 101], [1, 1], [1, 1]]
+    """
+    import itertools, multiprocessing, os, tempfile
+    if isinstance(grid, dict):
+        keys = sorted(grid)
+        grid = [dict(zip(keys, values)) for values in itertools.product(*[grid[k] for k in keys])]
+    tasks = [(i, params, ticks) for i, params in enumerate(grid)]
+    path, defaults = None, {}
+    if isinstance(base, Network):
+        fd, path = tempfile.mkstemp('.ckpt')
+        os.close(fd)
+        saved = base._saved, base._dirty
+        base.checkpoint(path, True)
+        base._saved, base._dirty = saved
+        for params in grid:
+            for key in params:
+                if key not in ('energy', 'capacity'): defaults[key] = getattr(base, key)
+    pool = multiprocessing.Pool(processes, _sweep_init, (base, path, defaults))
+    try:
+        for result in pool.imap_unordered(_sweep_run, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        if path: os.remove(path)
 
 
 def _test():
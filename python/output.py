@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Sink writers:  collect network output and write it out in batches on a background thread."""
+
+#A Sink calls its writer with (sink id, tick, bits) on every tick it holds energy.
+#network.print_writer prints each one, which makes stdout the bottleneck for busy networks.
+#BatchWriter instead appends to a list and hands full batches to a thread which calls
+#  a target with the batch:  FileTarget, Series, or any callable taking a list of (sink id, tick, bits).
+
+from array import array
+import threading, Queue
+
+from network import *
+
+
+class BatchWriter(object):
+    """Sink writer that buffers output and passes batches to target on a background thread.
+
+    >>> n = Network({1: {'s': 1}})
+    >>> n.attach(Sink, 's')
+    's'
+    >>> series = Series()
+    >>> w = attach(n, BatchWriter(series, 2))
+    >>> n.energy[1] = 3
+    >>> n(6); w.close()
+    >>> series['s']
+    ([1, 2, 3], [1, 1, 1])
+
+    An error in target is raised later, from the next write, flush or close after it happens:
+    >>> def broken(batch): raise IOError('disk full')
+    >>> w = BatchWriter(broken, 1)
+    >>> for tick in range(40): w('s', tick, 1)
+    Traceback (most recent call last):
+    IOError: disk full
+    >>> w.close()
+    Traceback (most recent call last):
+    IOError: disk full
+    """
+
+    __slots__ = ['target', 'size', 'batch', 'queue', 'thread', 'error']
+
+    def __init__(self, target, size=4096):
+        self.target = target    #called with each list of (sink id, tick, bits)
+        self.size = size        #items per batch
+        self.batch = []
+        self.queue = Queue.Queue(16)
+        self.thread = None
+        self.error = None       #first exception raised by target, re-raised by __call__, flush and close
+
+    def __call__(self, sink_id, tick, bits):
+        self._check()
+        self.batch.append((sink_id, tick, bits))
+        if len(self.batch) >= self.size:
+            self._send()
+
+    def _send(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._write)
+            self.thread.daemon = True
+            self.thread.start()
+        self.queue.put(self.batch)
+        self.batch = []
+
+    def _write(self):
+        batch = self.queue.get()
+        while batch is not None:
+            try:
+                if self.error is None: self.target(batch)  #after an error, just drain so nothing waits forever
+            except Exception, error:
+                self.error = error
+            finally: self.queue.task_done()
+            batch = self.queue.get()
+
+    def _check(self):
+        if self.error is not None: raise self.error
+
+    def flush(self):
+        """Hand over any partial batch and wait until all batches are written."""
+        if self.batch: self._send()
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        """Flush and stop the writing thread.  A later batch starts a new one."""
+        if self.batch: self._send()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self._check()
+
+
+class FileTarget(object):
+    """Batch target writing lines of "tick,sink id,bits" to a file.
+
+    >>> n = Network({1: {'s': 1}})
+    >>> n.attach(Sink, 's')
+    's'
+    >>> target = FileTarget(open('/tmp/sink.csv', 'w'))
+    >>> w = attach(n, BatchWriter(target))
+    >>> n.energy[1] = 2
+    >>> n(3); w.close(); target.close()
+    >>> print open('/tmp/sink.csv').read(),
+    1,s,1
+    2,s,1
+    """
+
+    __slots__ = ['file']
+
+    def __init__(self, f):
+        self.file = f
+
+    def __call__(self, batch):
+        self.file.write(''.join(["%s,%s,%s\n" % (tick, sid, bits) for sid, tick, bits in batch]))
+
+    def close(self):
+        self.file.close()
+
+
+class Series(dict):
+    """Batch target keeping a time series per sink:  {sink id: (ticks array, bits array)}.
+    Output of the same sink on the same tick is summed."""
+
+    __slots__ = []
+
+    def __call__(self, batch):
+        for sid, tick, bits in batch:
+            ticks, values = self.get(sid) or self.setdefault(sid, (array('l'), array('l')))
+            if ticks and ticks[-1] == tick:
+                values[-1] += bits
+            else:
+                ticks.append(tick)
+                values.append(bits)
+
+    def __getitem__(self, sid):
+        """Return (ticks, bits) lists for sink."""
+        ticks, values = dict.__getitem__(self, sid)
+        return ticks.tolist(), values.tolist()
+
+
+def attach(net, writer):
+    """Set writer on every Sink in net.  Returns writer."""
+    for node in net.itervalues():
+        if isinstance(node, Sink): node.writer = writer
+    return writer
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Per-tick metrics recorder for Network runs."""
+
+#Columns are preallocated arrays used as ring buffers, so recording never allocates per tick
+#  (except for the optional per-node energy deltas) and long runs keep only the last capacity ticks.
+
+from array import array
+import time
+
+from network import *
+
+COLUMNS = [('tick', 'l'), ('flow', 'l'), ('energy', 'l'), ('active', 'l'), ('sink', 'l'), ('seconds', 'd')]
+
+
+class Recorder(object):
+    """Records flow, total energy, active node count, sink output and wall time of each tick.
+
+    >>> n = Network({1: {2: 1}, 2: {3: 1}})
+    >>> n.attach(Sink, 's')
+    's'
+    >>> n[3]['s'] = 1
+    >>> n.energy[1] = 2
+    >>> r = Recorder(n, 4)
+    >>> n(6)
+    s: 1
+    s: 1
+    >>> len(r), r.count      #only the last 4 ticks are kept
+    (4, 6)
+    >>> c = r.columns()
+    >>> c['tick'], c['flow'], c['energy'], c['active'], c['sink']
+    ([2, 3, 4, 4], [2, 1, 0, 0], [2, 1, 0, 0], [2, 2, 1, 0], [0, 1, 1, 0])
+
+    Recording stops when the recorder is detached:
+    >>> n.recorder = None
+    >>> n(); r.count
+    6
+    """
+
+    __slots__ = ['network', 'capacity', 'count', 'deltas', '_columns', '_deltas']
+
+    def __init__(self, network, capacity=65536, deltas=False):
+        """Attach a recorder keeping the last capacity ticks of network.
+        If deltas is set, also keep the per-node energy change of each tick."""
+        self.network = network
+        self.capacity = capacity
+        self.count = 0      #ticks recorded since creation
+        self.deltas = deltas
+        self._columns = dict([(name, array(code, [0]) * capacity) for name, code in COLUMNS])
+        self._deltas = [None] * (deltas and capacity or 0)
+        network.recorder = self
+
+    def _tick(self):
+        """Advance the network one tick, recording its metrics.  Called by Network in place of Network._tick."""
+        net = self.network
+        energy = net.energy
+        before = self.deltas and dict(energy)
+        active = len(energy)
+        sink = 0
+        for nid, bits in energy.iteritems():
+            if isinstance(net[nid], Sink): sink += bits
+        tick = net.ticks
+        start = time.time()
+        flow = net._tick()
+        seconds = time.time() - start
+        i = self.count % self.capacity
+        c = self._columns
+        c['tick'][i], c['flow'][i], c['active'][i], c['sink'][i] = tick, flow, active, sink
+        c['energy'][i], c['seconds'][i] = sum(energy.itervalues()), seconds
+        if self.deltas:
+            delta = dict([(nid, energy[nid] - e) for nid, e in before.iteritems() if energy[nid] != e])
+            delta.update([(nid, e) for nid, e in energy.iteritems() if nid not in before])
+            self._deltas[i] = delta
+        self.count += 1
+        return flow
+
+    def __len__(self):
+        """Number of ticks currently held."""
+        return min(self.count, self.capacity)
+
+    def _order(self):
+        """Buffer indices in chronological order."""
+        start = self.count > self.capacity and self.count % self.capacity or 0
+        return range(start, len(self)) + range(0, start)
+
+    def columns(self):
+        """Return {column name: list of values}, oldest tick first."""
+        order = self._order()
+        return dict([(name, [col[i] for i in order]) for name, col in self._columns.iteritems()])
+
+    def energy_deltas(self):
+        """Return list of {node id: energy change} per tick, oldest first.  Requires deltas=True.
+
+        >>> n = Network({1: {2: 1}})
+        >>> n.energy[1] = 2
+        >>> r = Recorder(n, 10, deltas=True)
+        >>> n(3); r.energy_deltas()
+        [{1: -1, 2: 1}, {1: -1, 2: 1}, {}]
+        """
+        if not self.deltas: raise ValueError("Recorder not created with deltas=True")
+        return [self._deltas[i] for i in self._order()]
+
+    def to_csv(self, path):
+        """Write columns to path as CSV with a header row.
+
+        >>> n = Network({1: {2: 1}})
+        >>> n.energy[1] = 1
+        >>> r = Recorder(n)
+        >>> n(2); r.to_csv('/tmp/recorder.csv')
+        >>> print open('/tmp/recorder.csv').read().split()[:3]  #doctest: +ELLIPSIS
+        ['tick,flow,energy,active,sink,seconds', '0,1,1,1,0,...', '1,0,1,1,0,...']
+        """
+        import csv
+        names = [name for name, code in COLUMNS]
+        columns = self.columns()
+        f = open(path, 'wb')
+        try:
+            out = csv.writer(f)
+            out.writerow(names)
+            out.writerows(zip(*[columns[name] for name in names]))
+        finally: f.close()
+
+    def to_numpy(self):
+        """Return {column name: numpy array}, oldest tick first.  Requires numpy."""
+        import numpy
+        order = numpy.array(self._order(), dtype=int)
+        return dict([(name, numpy.frombuffer(col, dtype=col.typecode == 'd' and float or numpy.int_)[order])
+                     for name, col in self._columns.iteritems()])
+
+    def clear(self):
+        self.count = 0
+        if self.deltas: self._deltas = [None] * self.capacity
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Paced simulation runner:  ticks on a fixed schedule, input and output on background threads."""
+
+#network.run() alternates net(), display and sleep(), so slow input or output stretches every tick.
+#Here sources are fed by reader threads through queues (an empty queue is an idle tick, like KeySource),
+#  ticks are scheduled against absolute deadlines, and consumers get snapshots on their own threads.
+#XXX Python 2 has no asyncio or monotonic clock, so this uses threads and time.time().
+
+import os, threading, time, Queue
+
+from network import *
+
+
+class QueueSource(FileSource):
+    """Source whose input is read ahead by a background thread, so a slow file or pipe never blocks a tick.
+    Ticks when no input has arrived yet are skipped, like whitespace.
+
+    >>> fn = '/tmp/network.tmp'
+    >>> f = file(fn, 'w'); f.write('ab'); f.close()
+    >>> n = Network()
+    >>> n.attach(QueueSource, open(fn))
+    '/tmp/network.tmp'
+    >>> n[fn].reader.join()  #wait for all input to arrive
+    >>> n(5); print n
+    {'/tmp/network.tmp': 0 {'A': 1, 'B': 1}, 'A': 1 {}, 'B': 1 {}}
+
+    Input that has arrived may be gone from the file or pipe, so it can't be checkpointed:
+    >>> if os.path.exists('/tmp/queue.ckpt'): os.remove('/tmp/queue.ckpt')
+    >>> n.checkpoint('/tmp/queue.ckpt')
+    Traceback (most recent call last):
+    TypeError: QueueSource '/tmp/network.tmp' reads input that can't be read again, so can't be checkpointed
+    >>> os.path.exists('/tmp/queue.ckpt')
+    False
+    """
+
+    __slots__ = ['queue', 'reader']
+
+    def __init__(self, network, source_file, init={}, maxsize=16):
+        super(QueueSource, self).__init__(network, source_file, init)
+        self.queue = Queue.Queue(maxsize)   #filtered blocks, '' at EOF
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _read(self):
+        """Reader thread: queue filtered blocks as they become available."""
+        fd, put = self.source.fileno(), self.queue.put
+        block = os.read(fd, BLOCKSIZE)     #os.read returns what is ready instead of waiting for a full block
+        while block:
+            put(block.translate(FILTER_TABLE))
+            block = os.read(fd, BLOCKSIZE)
+        put('')
+
+    def _pull(self):
+        try:
+            bit_id = self._buffer[self._cursor]
+        except IndexError:
+            try:
+                self._buffer, self._cursor = self.queue.get_nowait(), 0
+            except Queue.Empty:
+                return " "  #nothing ready, idle tick
+            if not self._buffer: return self.source.close()
+            bit_id = self._buffer[0]
+        self._cursor += 1
+        return bit_id
+
+    def _getstate(self):
+        raise TypeError("QueueSource %r reads input that can't be read again, so can't be checkpointed" % self._id)
+    _mark, _rewind = Node._mark.im_func, Node._rewind.im_func  #nor rewound by a journal
+
+
+class Runner(object):
+    """Runs networks at a fixed tick rate, handing a snapshot of each tick to consumer threads.
+
+    Consumers are called as consumer(net, ticks, energy, flow) with a copy of the energy;
+    a consumer that falls behind loses snapshots (counted in dropped) rather than delaying ticks.
+
+    >>> n = Network({1: {2: 1}})
+    >>> n.energy[1] = 2
+    >>> seen = []
+    >>> r = Runner(rate=1000)
+    >>> r.add(n, 3)
+    >>> r.subscribe(lambda net, ticks, energy, flow: seen.append((ticks, energy)))
+    >>> r.run()
+    >>> seen, r.dropped
+    ([(1, {1: 1, 2: 1}), (2, {2: 2}), (2, {2: 2})], 0)
+
+    A consumer that fails gets no more snapshots, and its error is raised once the run is over:
+    >>> def broken(net, ticks, energy, flow): raise ValueError('bad snapshot')
+    >>> r = Runner(rate=1000)
+    >>> r.add(n, 3)
+    >>> r.subscribe(broken, maxsize=1)
+    >>> r.run()
+    Traceback (most recent call last):
+    ValueError: bad snapshot
+    >>> r.networks  #every tick was still run
+    []
+    """
+
+    __slots__ = ['rate', 'networks', 'consumers', 'dropped', 'late', 'error']
+
+    def __init__(self, rate=10):
+        self.rate = rate            #ticks per second
+        self.networks = []          #[network, ticks left]
+        self.consumers = []         #(function, queue)
+        self.dropped = 0            #snapshots not delivered because a consumer queue was full
+        self.late = 0               #ticks started after their deadline
+        self.error = None           #first exception raised by a consumer, re-raised by run
+
+    def add(self, net, ticks):
+        self.networks.append([net, ticks])
+
+    def subscribe(self, consumer, maxsize=1024):
+        self.consumers.append((consumer, Queue.Queue(maxsize)))
+
+    def _consume(self, consumer, queue):
+        """Consumer thread:  after an error, just drain so the tick loop and run never wait forever."""
+        failed = False
+        item = queue.get()
+        while item is not None:
+            if not failed:
+                try: consumer(*item)
+                except Exception, error:
+                    failed = True
+                    if self.error is None: self.error = error
+            item = queue.get()
+
+    def run(self):
+        """Tick every network once per period until each has run its ticks, then wait for consumers to finish."""
+        threads = []
+        for consumer, queue in self.consumers:
+            t = threading.Thread(target=self._consume, args=(consumer, queue))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        period = 1.0 / self.rate
+        deadline = time.time()
+        while self.networks:
+            for entry in self.networks[:]:
+                net = entry[0]
+                flow = net._tick() if net.recorder is None else net.recorder._tick()
+                for consumer, queue in self.consumers:
+                    try: queue.put_nowait((net, net.ticks, dict(net.energy), flow))
+                    except Queue.Full: self.dropped += 1
+                entry[1] -= 1
+                if entry[1] <= 0: self.networks.remove(entry)
+            deadline += period
+            delay = deadline - time.time()
+            if delay > 0: time.sleep(delay)
+            else:
+                self.late += 1
+                deadline = time.time()  #don't try to catch up with a burst of ticks
+        for consumer, queue in self.consumers:
+            queue.put(None)
+        for t in threads:
+            t.join()
+        if self.error is not None: raise self.error
+
+
+def display(net, ticks, energy, flow):
+    """Consumer printing the energy of each tick, like Network.display_energy."""
+    print "tick %s, flow %s: %s" % (ticks, flow, FlowType(energy))
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
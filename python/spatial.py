@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Spatial index of spheres (node positions and radii) for placement, picking and collision checks, needing no display."""
+
+#A uniform grid:  each sphere is kept in the cube of side cell holding its centre, so inserting and moving
+#  are dict operations, and a query only looks at the cubes within reach of its point plus the largest
+#  radius.  With cell about twice the usual radius, a query looks at a few spheres whatever their number,
+#  which is what demo.py's "place somewhat randomly, and then check for collision" needs for big scenes.
+#nearest() searches shells of cubes outward until no closer sphere can be found.
+
+import math, random
+
+
+class SpatialGrid(object):
+    """Spheres by id, indexed by position.
+
+    >>> space = SpatialGrid(10)
+    >>> space.insert('a', (0, 0, 0), 5); space.insert('b', (30, 0, 0), 2)
+    >>> space.within((12, 0, 0), 8), space.collides((5, 0, 0), 1)
+    (['a'], ['a'])
+    >>> space.nearest((25, 1, 0))
+    ('b', 3.0990195135927845)
+    >>> space.move('b', (100, 100, 100)); space.nearest((25, 1, 0))[0]
+    'a'
+    >>> pos = space.place('c', 5, rng=random.Random(1))
+    >>> space.collides(pos, 5, exclude='c'), len(space)
+    ([], 3)
+    """
+
+    __slots__ = ['cell', 'cells', 'pos', 'radius', 'max_radius', 'low', 'high']
+
+    def __init__(self, cell=20.0):
+        self.cell = float(cell)     #side of grid cubes, best about twice the usual radius
+        self.cells = {}             #{(i, j, k): set of ids with centre in that cube}
+        self.pos = {}               #{id: (x, y, z)}
+        self.radius = {}            #{id: radius}
+        self.max_radius = 0.0       #largest radius inserted, so queries reach far enough
+        self.low = self.high = None #lowest and highest cube along each axis that has been used
+
+    def _key(self, point):
+        cell = self.cell
+        return int(math.floor(point[0] / cell)), int(math.floor(point[1] / cell)), int(math.floor(point[2] / cell))
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __contains__(self, vid):
+        return vid in self.pos
+
+    def insert(self, vid, point, radius=0.0):
+        """Add sphere vid, or move it if it's there already."""
+        if vid in self.pos: self.remove(vid)
+        point = tuple([float(x) for x in point])
+        self.pos[vid], self.radius[vid] = point, radius
+        self._add(self._key(point), vid)
+        if radius > self.max_radius: self.max_radius = float(radius)
+
+    def _add(self, key, vid):
+        self.cells.setdefault(key, set()).add(vid)
+        if self.low is None: self.low = self.high = key
+        else:
+            self.low = tuple(map(min, self.low, key))
+            self.high = tuple(map(max, self.high, key))
+
+    def remove(self, vid):
+        key = self._key(self.pos.pop(vid))
+        del self.radius[vid]
+        members = self.cells[key]
+        members.discard(vid)
+        if not members: del self.cells[key]
+
+    def move(self, vid, point):
+        """Move sphere vid to point.  Only changes the grid when it crosses into another cube."""
+        point = tuple([float(x) for x in point])
+        old, new = self._key(self.pos[vid]), self._key(point)
+        if old != new:
+            members = self.cells[old]
+            members.discard(vid)
+            if not members: del self.cells[old]
+            self._add(new, vid)
+        self.pos[vid] = point
+
+    def _candidates(self, point, reach):
+        """Yield ids whose centre is in a cube within reach of point."""
+        lo, hi = self._key([x - reach for x in point]), self._key([x + reach for x in point])
+        cells = self.cells
+        if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) * (hi[2] - lo[2] + 1) > len(cells):
+            for key, members in cells.iteritems():    #fewer cubes in use than in reach
+                if all([lo[c] <= key[c] <= hi[c] for c in range(3)]):
+                    for vid in members: yield vid
+            return
+        for i in xrange(lo[0], hi[0] + 1):
+            for j in xrange(lo[1], hi[1] + 1):
+                for k in xrange(lo[2], hi[2] + 1):
+                    members = cells.get((i, j, k))
+                    if members:
+                        for vid in members: yield vid
+
+    def _gap(self, vid, point):
+        """Distance from point to the surface of sphere vid, negative inside it."""
+        p = self.pos[vid]
+        return math.sqrt((p[0] - point[0]) ** 2 + (p[1] - point[1]) ** 2 + (p[2] - point[2]) ** 2) - self.radius[vid]
+
+    def within(self, point, distance):
+        """Return sorted ids of spheres coming within distance of point."""
+        return sorted([vid for vid in self._candidates(point, distance + self.max_radius)
+                       if self._gap(vid, point) <= distance])
+
+    def collides(self, point, radius, gap=0.0, exclude=None):
+        """Return sorted ids of spheres that a sphere of radius at point would overlap (or come within gap of)."""
+        reach = radius + gap
+        return sorted([vid for vid in self._candidates(point, reach + self.max_radius)
+                       if vid != exclude and self._gap(vid, point) < reach])
+
+    def nearest(self, point, exclude=None):
+        """Return (id, distance to its surface) of the sphere nearest to point, or None if there's none.
+        The distance is negative when point is inside, so this also picks the sphere under a pointer."""
+        if not self.pos or self.pos.keys() == [exclude]: return None
+        centre, cell, best = self._key(point), self.cell, None
+        extent = max([max(centre[c] - self.low[c], self.high[c] - centre[c]) for c in range(3)])
+        for shell in xrange(extent + 1):
+            #spheres further out have centres at least (shell - 1) * cell away
+            if best is not None and (shell - 1) * cell - self.max_radius > best[1]: break
+            if 24 * shell * shell > len(self.cells):     #shell has more cubes than are in use:  check every sphere
+                return min([(self._gap(vid, point), vid) for vid in self.pos if vid != exclude] +
+                           ([(best[1], best[0])] if best else []))[::-1]
+            for vid in self._shell(centre, shell):
+                if vid == exclude: continue
+                gap = self._gap(vid, point)
+                if best is None or gap < best[1] or (gap == best[1] and vid < best[0]): best = vid, gap
+        return best
+
+    def _shell(self, centre, shell):
+        """Yield ids in cubes at distance shell (counted in cubes, along the largest axis) from centre."""
+        cells = self.cells
+        ci, cj, ck = centre
+        for i in xrange(ci - shell, ci + shell + 1):
+            for j in xrange(cj - shell, cj + shell + 1):
+                edge = abs(i - ci) == shell or abs(j - cj) == shell
+                for k in (xrange(ck - shell, ck + shell + 1) if edge else set((ck - shell, ck + shell))):
+                    members = cells.get((i, j, k))
+                    if members:
+                        for vid in members: yield vid
+
+    def place(self, vid, radius, centre=(0.0, 0.0, 0.0), spread=None, gap=0.0, attempts=30, rng=random):
+        """Insert sphere vid at a random point within spread of centre where it overlaps no other,
+        and return the point.  The spread doubles after each attempts failures."""
+        if spread is None: spread = self.cell
+        while True:
+            for i in xrange(attempts):
+                point = [c + rng.uniform(-spread, spread) for c in centre]
+                if not self.collides(point, radius, gap, vid):
+                    self.insert(vid, point, radius)
+                    return self.pos[vid]
+            spread *= 2
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# This file is part of PanGaia and licensed under the GNU General Public License v3 found at <http://www.gnu.org/licenses>
+# email: dreamingforward@gmail.com
+
+"""Index of the tokens learned by a hierarchy of LayerNets:  the layer, energy and edges of each,
+tokens beginning with a prefix, and the tokens of highest energy on a layer."""
+
+#TokenIndex attaches itself to each layer (LayerNet.index), and layers call it as they add and remove
+#  bits and change energy, so queries never scan the networks.  Each layer has its own trie and energy
+#  buckets, written only by that layer, so the stages of a Pipeline don't share any.  Query after
+#  Pipeline.flush().  Changes made to a layer other than by pulls and evict() aren't seen.
+#A trie is nested dicts keyed by character, with None mapping to the token that ends there.  Tokens
+#  that aren't strings (ints, etc. pulled as bits) are single opaque symbols, keyed whole.
+#Buckets map each energy to the set of tokens having it, and the energies are kept in a sorted list,
+#  so an energy change moves a token between two buckets and top() reads down from the highest energy.
+
+from bisect import bisect_left, insort
+
+from input import *
+
+
+def _symbols(token):
+    """Trie keys spelling token:  its characters, or token itself if it isn't a string."""
+    if isinstance(token, basestring): return token
+    return (token,)
+
+
+class TokenIndex(object):
+    """Index of the bits of network and the layers above it, kept up to date as they learn.
+
+    >>> s = SerialIn()
+    >>> index = TokenIndex(s.upnet)
+    >>> from StringIO import StringIO
+    >>> s.pull(StringIO('the then there that they the them other ' * 8))
+    >>> index.find('THEY')
+    (2, 2, {'HEHE': 2})
+    >>> 'THE' in index, index.prefixed('TH')
+    (False, ['TH', 'THEY', 'THTH'])
+    >>> index.top(1, 3)
+    [('HE', 34), ('TH', 21), ('EN', 5)]
+
+    Layers that already hold bits are indexed when attached:
+    >>> TokenIndex(s.upnet).top(2) == index.top(2)
+    True
+
+    Bits that aren't strings are indexed whole:
+    >>> s = SerialIn()
+    >>> index = TokenIndex(s.upnet)
+    >>> s.pull([7, 8, ' ', 7, 8, ' ', 'AB'])
+    >>> index.find(7), index.prefixed('', 0)
+    ((0, 2, {8: 2}), [7, 8, 'AB'])
+    """
+
+    __slots__ = ['layers', 'tries', 'buckets', 'energies']
+
+    def __init__(self, network):
+        self.layers = []    #LayerNet of each depth, None below network
+        self.tries = []     #of each depth
+        self.buckets = []   #{energy: set of tokens} of each depth
+        self.energies = []  #sorted energies with a bucket, of each depth
+        layer = network
+        while layer is not None:
+            self._layer(layer)
+            for token in layer:
+                self._add(layer.depth, token)
+            for token, energy in layer.energy.iteritems():
+                self._energy(layer.depth, token, 0, energy)
+            layer = layer.upnet
+
+    def _layer(self, layer):
+        """Called by LayerNet when creating a layer."""
+        while len(self.layers) <= layer.depth:
+            for lists in self.layers, self.tries, self.buckets, self.energies:
+                lists.append(None)
+        depth = layer.depth
+        self.layers[depth], self.tries[depth], self.buckets[depth], self.energies[depth] = layer, {}, {}, []
+        layer.index = self
+
+    def _add(self, depth, token):
+        """Called by LayerNet when adding a bit."""
+        node = self.tries[depth]
+        for c in _symbols(token):
+            node = node.get(c) or node.setdefault(c, {})
+        node[None] = token
+
+    def _remove(self, depth, token, energy):
+        """Called by LayerNet before removing a bit."""
+        self._energy(depth, token, energy, 0)
+        path, node = [], self.tries[depth]
+        for c in _symbols(token):
+            path.append((node, c))
+            node = node[c]
+        del node[None]
+        for node, c in reversed(path):  #prune branches left empty
+            if node[c]: break
+            del node[c]
+
+    def _energy(self, depth, token, old, new):
+        """Called by LayerNet when the energy of a bit changes."""
+        if old == new: return
+        buckets, energies = self.buckets[depth], self.energies[depth]
+        if old:
+            bucket = buckets[old]
+            bucket.discard(token)
+            if not bucket:
+                del buckets[old]
+                del energies[bisect_left(energies, old)]
+        if new:
+            bucket = buckets.get(new)
+            if bucket is None:
+                bucket = buckets[new] = set()
+                insort(energies, new)
+            bucket.add(token)
+
+    def _lookup(self, depth, prefix):
+        """Return trie node reached by prefix on depth, or None."""
+        node = self.tries[depth]
+        for c in _symbols(prefix):
+            node = node.get(c)
+            if node is None: return None
+        return node
+
+    def _depths(self, depth=None):
+        if depth is not None: return [depth]
+        return [d for d in range(len(self.tries)) if self.tries[d] is not None]
+
+    def find(self, token):
+        """Return (depth, energy, {tail: count}) of token, or None if it hasn't been learned."""
+        for depth in self._depths():
+            node = self._lookup(depth, token)
+            if node is not None and None in node:
+                layer = self.layers[depth]
+                return depth, layer.energy[token], dict(dict.__getitem__(layer, token))
+        return None
+
+    def __contains__(self, token):
+        return self.find(token) is not None
+
+    def prefixed(self, prefix, depth=None):
+        """Return sorted list of tokens beginning with prefix, on depth or on any layer."""
+        tokens = []
+        for d in self._depths(depth):
+            node = self._lookup(d, prefix)
+            stack = node is not None and [node] or []
+            while stack:
+                node = stack.pop()
+                for c, child in node.iteritems():
+                    if c is None: tokens.append(child)
+                    else: stack.append(child)
+        return sorted(tokens)
+
+    def top(self, depth, k=10):
+        """Return [(token, energy)] of the k tokens of highest energy on depth, ties in token order."""
+        buckets, result = self.buckets[depth], []
+        for energy in reversed(self.energies[depth]):
+            for token in sorted(buckets[energy]):
+                if len(result) == k: return result
+                result.append((token, energy))
+        return result
+
+
+if __name__ == '__main__':
+    import doctest
+    print doctest.testmod()